@@ -4,23 +4,18 @@
 To add a brief summary of this script.
 """
 
-import csv
-import gzip
 import json
 import logging
+import multiprocessing
 import os
 import warnings
 from argparse import ArgumentParser
-from collections import defaultdict
 
 import numpy as np
 from Bio import BiopythonWarning
-from Bio import SeqIO
-from Bio.PDB import is_aa
-from Bio.SeqUtils import seq1
 
 from cosmis.mapping.sifts import SIFTS
-from cosmis.utils import pdb_utils, seq_utils
+from cosmis.utils import io_utils, pdb_utils, seq_utils
 
 warnings.simplefilter('ignore', BiopythonWarning)
 
@@ -75,38 +70,43 @@ def parse_cmd():
         '-l', '--log', dest='log', default='cosmis.log',
         help='''The file to which to write detailed computing logs.'''    
     )
+    parser.add_argument(
+        '-n', '--nprocs', dest='nprocs', type=int, default=1,
+        help='''Number of processes used to compute COSMIS scores of
+        different proteins in parallel.'''
+    )
                     
     return parser.parse_args()
 
 
-def get_ensembl_accession(record):
+def get_ensembl_accession(record_id):
     """
 
     Parameters
     ----------
-    record : str
+    record_id : str
         Record ID is of the format: ">CCDS2.2|Hs109|chr1"
 
     Returns
     -------
 
     """
-    parts = record.id.split('.')
+    parts = record_id.split('.')
     return parts[0]
 
 
-def get_uniprot_accession(record):
+def get_uniprot_accession(record_id):
     """
 
     Parameters
     ----------
-    record
+    record_id
 
     Returns
     -------
 
     """
-    parts = record.id.split('|')
+    parts = record_id.split('|')
     return parts[1]
 
 
@@ -128,42 +128,6 @@ def parse_config(config):
     return configs
 
 
-def count_variants(variants):
-    """
-    Collects the statistics about position-specific counts of missense and
-    synonymous variants.
-
-    Parameters
-    ----------
-    variants : list
-        A list of variant identifiers: ['A123B', 'C456D']
-
-    Returns
-    -------
-    dict
-        A dictionary where the key is amino acid position and the value is
-        the number of variants at this position. One dictionary for missense
-        variants and one dictionary for synonymous variants.
-
-    """
-    #
-    missense_counts = defaultdict(int)
-    synonymous_counts = defaultdict(int)
-    for variant in variants:
-        vv, _, _ = variant
-        w = vv[0]  # wild-type amino acid
-        v = vv[-1]  # mutant amino acid
-        pos = vv[1:-1]  # position in the protein sequence
-        # only consider rare variants
-        # if int(ac) / int(an) > 0.001:
-        #    continue
-        if w != v:  # missense variant
-            missense_counts[int(pos)] += 1
-        else:  # synonymous variant
-            synonymous_counts[int(pos)] += 1
-    return missense_counts, synonymous_counts
-
-
 def retrieve_data(uniprot_id, enst_ids, pep_dict, cds_dict, variant_dict):
     """
     """
@@ -171,7 +135,7 @@ def retrieve_data(uniprot_id, enst_ids, pep_dict, cds_dict, variant_dict):
 
     valid_ensts = []
     for enst_id in enst_ids:
-        cds_seq = cds_dict[enst_id].seq
+        cds_seq = cds_dict[enst_id]
         # skip if the CDS is incomplete
         if not seq_utils.is_valid_cds(cds_seq):
             print('Error: Invalid CDS.'.format(enst_id))
@@ -185,7 +149,7 @@ def retrieve_data(uniprot_id, enst_ids, pep_dict, cds_dict, variant_dict):
 
     if len(valid_ensts) == 1:
         enst_id = valid_ensts[0]
-        cds = cds_dict[enst_id].seq
+        cds = cds_dict[enst_id]
         if enst_id not in variant_dict.keys():
            raise KeyError('Error: No record for {} in gnomAD.'.format(uniprot_id))
         variants = variant_dict[enst_id]['variants']
@@ -203,7 +167,7 @@ def retrieve_data(uniprot_id, enst_ids, pep_dict, cds_dict, variant_dict):
         if max_len < var_pos:
             max_len = var_pos
             right_enst = enst_id
-    cds = cds_dict[right_enst].seq
+    cds = cds_dict[right_enst]
     variants = variant_dict[right_enst]['variants']
 
     return right_enst, pep_seq, cds, variants
@@ -231,55 +195,81 @@ def get_dataset_headers():
     return header
 
 
-def main():
-    # parse command-line arguments
-    args = parse_cmd()
+# columns written in scientific notation, all other floating point columns
+# are written with three decimal places
+SCI_COLUMNS = ('cs_syn_prob', 'cs_mis_prob', 'mis_p_value', 'syn_p_value')
 
-    # configure the logging system
-    logging.basicConfig(
-        filename=args.log,
-        level=logging.INFO,
-        filemode='w',
-        format='%(levelname)s:%(asctime)s:%(message)s'
-    )
+# columns copied from the transcript-level counts, written without rounding
+RAW_COLUMNS = ('enst_syn_obs', 'enst_mis_obs', 'enst_syn_exp', 'enst_mis_exp')
 
-    # parse configuration file
-    configs = parse_config(args.config)
-    logging.info('Supplied configuration:')
-    logging.info(json.dumps(configs, sort_keys=True, indent=4))
 
+# databases shared by all worker processes, set by init_worker
+DATASETS = {}
+
+
+def init_worker(datasets):
+    """
+    Makes the parsed databases available to compute_cosmis. Used as the
+    initializer of worker processes so that the databases are inherited by
+    the workers instead of being pickled with every task.
+
+    Parameters
+    ----------
+    datasets : dict
+        Command-line arguments, configurations and parsed databases.
+
+    Returns
+    -------
+    None
+
+    """
+    global DATASETS
+    DATASETS = datasets
+
+
+def load_datasets(args, configs):
+    """
+    Loads the databases needed to compute COSMIS scores.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Parsed command-line arguments.
+    configs : dict
+        Configurations read from the configuration file.
+
+    Returns
+    -------
+    dict
+        Command-line arguments, configurations and parsed databases, to be
+        passed to init_worker.
+
+    """
     # reading ENSEMBL cds
     print('Reading ENSEMBL CDS database ...')
-    with gzip.open(configs['ensembl_cds'], 'rt') as cds_handle:
-        cds_dict = SeqIO.to_dict(
-            SeqIO.parse(cds_handle, format='fasta'),
-            key_function=get_ensembl_accession
-        )
+    cds_dict = io_utils.read_fasta(
+        configs['ensembl_cds'], key_function=get_ensembl_accession
+    )
 
     # UniProt protein sequences
     print('Reading UniProt protein sequence database ...')
-    with gzip.open(configs['uniprot_pep'], 'rt') as pep_handle:
-        pep_dict = SeqIO.to_dict(
-            SeqIO.parse(pep_handle, format='fasta'),
-            key_function=get_uniprot_accession
-        )
+    pep_dict = io_utils.read_fasta(
+        configs['uniprot_pep'], key_function=get_uniprot_accession
+    )
 
     # parse gnomad transcript-level variants
     print('Reading gnomAD variant database ...')
-    with open(configs['gnomad_variants'], 'rt') as variant_handle:
-        # transcript_variants will be a dict of dicts where major version
-        # ENSEMBL transcript IDs are the first level keys and "ccds", "ensp",
-        # "swissprot", "variants" are the second level keys. The value of each
-        # second-level key is a Python list.
-        variant_dict = json.load(variant_handle)
+    # variant_dict will be a dict of dicts where major version
+    # ENSEMBL transcript IDs are the first level keys and "ccds", "ensp",
+    # "swissprot", "variants" are the second level keys. The value of each
+    # second-level key is a Python list.
+    variant_dict = io_utils.load_json(configs['gnomad_variants'])
 
     # parse the file that maps protein UniProt IDs to PDB IDs
-    with open(configs['uniprot_to_pdb'], 'rt') as ipf:
-        uniprot_to_pdb = json.load(ipf)
+    uniprot_to_pdb = io_utils.load_json(configs['uniprot_to_pdb'])
 
     # parse the file that maps Ensembl transcript IDs to PDB IDs 
-    with open(configs['uniprot_to_enst'], 'rt') as ipf:
-        uniprot_to_enst = json.load(ipf)
+    uniprot_to_enst = io_utils.load_json(configs['uniprot_to_enst'])
 
     # get transcript mutation probabilities and variant counts
     print('Reading transcript mutation probabilities and variant counts ...')
@@ -291,288 +281,403 @@ def main():
     # create SIFTS mapping table
     sifts_residue_mapping = SIFTS(configs['sifts_uniprot'], configs['pdb_dir'])
 
-    # compute the COSMIS scores for each transcript
-    with open(args.uniprot_ids, 'rt') as ipf:
-        for line in ipf:
-            uniprot_id = line.strip()
-            print('Processing UniProt ID: %s' % uniprot_id)
-            cosmis = []
-            if args.multimer:
-                output_suffix = '_cosmis_multimer.tsv'
-            else:
-                output_suffix = '_cosmis_monomer.tsv'
-            cosmis_file = os.path.join(output_dir, uniprot_id + output_suffix)
-            # skip if it was already computed and overwrite not requested
-            if os.path.exists(cosmis_file) and not args.overwrite:
-                print('Scores for %s already exist, skipped.' % uniprot_id)
-                continue
-            #
-            try:
-                enst_ids = uniprot_to_enst[uniprot_id]
-            except KeyError:
-                logging.critical(
-                    'No transcript IDs were mapped to {}.'.format(uniprot_id)
-                )
-                continue
-            try:
-                right_enst, pep_seq, cds, variants = retrieve_data(
-                    uniprot_id, enst_ids, pep_dict, cds_dict, variant_dict
-                )
-            except ValueError:
-                logging.critical('No valid CDS found for {}.'.format(uniprot_id))
-                continue
-            except KeyError:
-                logging.critical('No transcript record found for {} in gnomAD.'.format(uniprot_id))
-                continue
+    # everything the workers need to compute COSMIS scores of a protein
+    return {
+        'args': args,
+        'configs': configs,
+        'cds_dict': cds_dict,
+        'pep_dict': pep_dict,
+        'variant_dict': variant_dict,
+        'uniprot_to_pdb': uniprot_to_pdb,
+        'uniprot_to_enst': uniprot_to_enst,
+        'enst_mp_counts': enst_mp_counts,
+        'output_dir': output_dir,
+        'sifts_residue_mapping': sifts_residue_mapping
+    }
+
+
+def load_worker_datasets(args, configs):
+    """
+    Loads the databases in a worker process and makes them available to
+    compute_cosmis. Used as the initializer of worker processes that cannot
+    inherit the databases from the parent process.
 
-            # calculate expected counts for each codon
-            cds = cds[:-3]  # remove the stop codon
-            codon_mutation_rates = seq_utils.get_codon_mutation_rates(cds)
-            all_cds_ns_counts = seq_utils.count_poss_ns_variants(cds)
-            all_cds_ns_sites = seq_utils.count_ns_sites(cds)
-
-            # tabulate variants at each site
-            missense_counts, synonymous_counts = count_variants(variants)
-
-            # convert variant count to site variability
-            site_variability_missense = {
-                pos: 1 for pos, _ in missense_counts.items()
-            }
-            site_variability_synonymous = {
-                pos: 1 for pos, _ in synonymous_counts.items()
-            }
-
-            # compute the total number of missense variants
-            try:
-                total_exp_mis_counts = enst_mp_counts[right_enst][-1]
-                total_exp_syn_counts = enst_mp_counts[right_enst][-2]
-            except KeyError:
-                print(
-                    'Transcript {} not found in {}'.format(
-                        right_enst, configs['enst_mp_counts'])
-                )
-                continue
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Parsed command-line arguments.
+    configs : dict
+        Configurations read from the configuration file.
+
+    Returns
+    -------
+    None
+
+    """
+    init_worker(load_datasets(args, configs))
+
+
+def compute_cosmis(uniprot_id):
+    """
+    Computes COSMIS scores for the given protein and writes them to a file
+    in the output directory.
+
+    Parameters
+    ----------
+    uniprot_id : str
+        UniProt ID of the protein.
+
+    Returns
+    -------
+    None
+
+    """
+    args = DATASETS['args']
+    configs = DATASETS['configs']
+    cds_dict = DATASETS['cds_dict']
+    pep_dict = DATASETS['pep_dict']
+    variant_dict = DATASETS['variant_dict']
+    uniprot_to_pdb = DATASETS['uniprot_to_pdb']
+    uniprot_to_enst = DATASETS['uniprot_to_enst']
+    enst_mp_counts = DATASETS['enst_mp_counts']
+    output_dir = DATASETS['output_dir']
+    sifts_residue_mapping = DATASETS['sifts_residue_mapping']
+
+    print('Processing UniProt ID: %s' % uniprot_id)
+    cosmis = []
+    if args.multimer:
+        output_suffix = '_cosmis_multimer.tsv'
+    else:
+        output_suffix = '_cosmis_monomer.tsv'
+    cosmis_file = os.path.join(output_dir, uniprot_id + output_suffix)
+    # skip if it was already computed and overwrite not requested
+    if os.path.exists(cosmis_file) and not args.overwrite:
+        print('Scores for %s already exist, skipped.' % uniprot_id)
+        return
+    #
+    try:
+        enst_ids = uniprot_to_enst[uniprot_id]
+    except KeyError:
+        logging.critical(
+            'No transcript IDs were mapped to {}.'.format(uniprot_id)
+        )
+        return
+    try:
+        right_enst, pep_seq, cds, variants = retrieve_data(
+            uniprot_id, enst_ids, pep_dict, cds_dict, variant_dict
+        )
+    except ValueError:
+        logging.critical('No valid CDS found for {}.'.format(uniprot_id))
+        return
+    except KeyError:
+        logging.critical('No transcript record found for {} in gnomAD.'.format(uniprot_id))
+        return
+
+    # calculate expected counts for each codon
+    cds = cds[:-3]  # remove the stop codon
+    codon_mutation_rates = seq_utils.get_codon_mutation_rates(cds)
+    all_cds_ns_counts = seq_utils.count_poss_ns_variants(cds)
+    all_cds_ns_sites = seq_utils.count_ns_sites(cds)
+
+    # tabulate variants at each site, the count arrays are indexed
+    # by amino acid position so that the totals of a contact set can
+    # be obtained by a single reduction
+    mis_count_arr, syn_count_arr = seq_utils.tabulate_variants(
+        variants, len(pep_seq)
+    )
+
+    # convert variant count to site variability
+    mis_var_arr = (mis_count_arr > 0).astype(np.int32)
+    syn_var_arr = (syn_count_arr > 0).astype(np.int32)
+
+    # per-codon arrays indexed by zero-based codon number
+    cds_ns_counts_arr = np.array(all_cds_ns_counts)
+    cds_ns_sites_arr = np.array(all_cds_ns_sites)
+    codon_rates_arr = np.array(codon_mutation_rates)
+
+    # compute the total number of missense variants
+    try:
+        total_exp_mis_counts = enst_mp_counts[right_enst][-1]
+        total_exp_syn_counts = enst_mp_counts[right_enst][-2]
+    except KeyError:
+        print(
+            'Transcript {} not found in {}'.format(
+                right_enst, configs['enst_mp_counts'])
+        )
+        return
+
+    # permutation test
+    codon_mis_probs = [x[1] for x in codon_mutation_rates]
+    codon_syn_probs = [x[0] for x in codon_mutation_rates]
+    mis_p = codon_mis_probs / np.sum(codon_mis_probs)
+    syn_p = codon_mis_probs / np.sum(codon_syn_probs)
+    mis_pmt_matrix = seq_utils.permute_variants(
+        total_exp_mis_counts, len(pep_seq), mis_p
+    )
+    syn_pmt_matrix = seq_utils.permute_variants(
+        total_exp_syn_counts, len(pep_seq), syn_p
+    )
+
+    # get the PDB ID and PDB chain associated with this transcript
+    try:
+        pdb_id, pdb_chain = uniprot_to_pdb[uniprot_id]
+    except KeyError:
+        logging.critical(
+            '%s not found in given database %s',
+            uniprot_id, configs['uniprot_to_pdb']
+        )
+        logging.critical('%s was skipped ...', uniprot_id)
+        print('%s not found in given database %s' %
+              (uniprot_id, configs['uniprot_to_pdb']))
+        print('%s was skipped ...' % uniprot_id)
+        return
+
+    # print message
+    print(
+        'Estimating COSMIS scores for:', uniprot_id, 
+        right_enst, pdb_id, pdb_chain
+    )
+
+    chain = pdb_utils.get_pdb_chain(
+        pdb_id, pdb_chain, configs['pdb_dir'], 'mmCif'
+    )
+
+    if chain is None:
+        print('No chain was available for %s' % uniprot_id)
+        return
+
+    # get all contact pairs in the PDB structure
+    if args.multimer:
+        structure = pdb_utils.get_structure(pdb_id, configs['pdb_dir'], 'mmCif')
+        all_aa_residues = [
+            aa for aa in structure.get_residues()
+            if aa.get_resname() in pdb_utils.AA3
+        ]
+    else:
+        all_aa_residues = [
+            aa for aa in chain.get_residues()
+            if aa.get_resname() in pdb_utils.AA3
+        ]
+
+    # index the residue numbers of all contacts by residue
+    indexed_contacts = pdb_utils.index_contact_positions(
+        all_aa_residues, radius=args.radius
+    )
 
-            # permutation test
-            codon_mis_probs = [x[1] for x in codon_mutation_rates]
-            codon_syn_probs = [x[0] for x in codon_mutation_rates]
-            mis_p = codon_mis_probs / np.sum(codon_mis_probs)
-            syn_p = codon_mis_probs / np.sum(codon_syn_probs)
-            mis_pmt_matrix = seq_utils.permute_variants(
-                total_exp_mis_counts, len(pep_seq), mis_p
+    # one-to-one mapping between UniProt residues and PDB residues
+    # used later in determining count of variants in contact set
+    uniprot_to_pdb_mapping = sifts_residue_mapping.uniprot_to_pdb(
+        uniprot_id, pdb_id, pdb_chain
+    )
+    pdb_to_uniprot_mapping = {v: k for k, v in uniprot_to_pdb_mapping.items()}
+    if uniprot_to_pdb_mapping is None or pdb_to_uniprot_mapping is None:
+        print('Mapping between UniProt and PDB failed! Skipped!')
+        return
+
+    # row identifier for each COSMIS score record
+    id_fields = [uniprot_id, right_enst]
+
+    # determine the contact set of each residue first so that the
+    # permutation statistics of all contact sets can be computed
+    # together instead of residue by residue
+    contact_sets = []
+    for i, a in enumerate(pep_seq, start=1):
+        # @TODO need to get the corresponding position in the PDB file
+        # It is highly likely that the amino acid at position i in the
+        # PDB file will not be the same amino acid at position i in the
+        # ENSP peptide sequence
+        try:
+            pdb_pos = uniprot_to_pdb_mapping[i]
+            res = chain[pdb_pos]
+        except KeyError:
+            logging.critical(
+                'Residue %s in %s not found in chain %s in PDB file: %s', 
+                i, uniprot_id, pdb_chain, pdb_id
             )
-            syn_pmt_matrix = seq_utils.permute_variants(
-                total_exp_syn_counts, len(pep_seq), syn_p
+            continue
+
+        # check that the amino acid in ENSP sequence matches 
+        # that in the PDB structure
+        pdb_aa = pdb_utils.THREE_TO_ONE.get(res.get_resname(), 'X')
+        if a != pdb_aa:
+            logging.critical(
+                'Residue in %s did not match that in PDB %s '
+                'chain %s at %s: %s vs %s',
+                uniprot_id, pdb_id, pdb_chain, i, a, pdb_aa
             )
+            continue
 
-            # get the PDB ID and PDB chain associated with this transcript
-            try:
-                pdb_id, pdb_chain = uniprot_to_pdb[uniprot_id]
-            except KeyError:
+        # only consider contacts within the same protein
+        contacts_pdb_pos = [
+            x for x in indexed_contacts.get(res.get_full_id(), [])
+            if x in pdb_to_uniprot_mapping
+        ]
+
+        all_uniprot_pos = []
+        for j in contacts_pdb_pos:
+            # @TODO need to get the corresponding position in ENSP
+            # amino acid sequence using the SIFTS mapping table
+            uniprot_pos = pdb_to_uniprot_mapping[j]
+            if uniprot_pos > len(all_cds_ns_counts):
                 logging.critical(
-                    '%s not found in given database %s',
-                    uniprot_id, configs['uniprot_to_pdb']
+                    'PDB residue %s in %s chain %s out of the range '
+                    'of %s codons, something must be wrong with SIFTS mapping',
+                    j, pdb_id, pdb_chain, right_enst
                 )
-                logging.critical('%s was skipped ...', uniprot_id)
-                print('%s not found in given database %s' %
-                      (uniprot_id, configs['uniprot_to_pdb']))
-                print('%s was skipped ...' % uniprot_id)
                 continue
+            all_uniprot_pos.append(uniprot_pos)
 
-            # print message
-            print(
-                'Estimating COSMIS scores for:', uniprot_id, 
-                right_enst, pdb_id, pdb_chain
-            )
+        contact_sets.append(
+            (i, a, pdb_pos, pdb_aa, contacts_pdb_pos, all_uniprot_pos)
+        )
+
+    # permuted variant counts summed over each contact set
+    cs_sites_list = [x[-1] + [x[0]] for x in contact_sets]
+    mis_pmt_sums, syn_pmt_sums = seq_utils.get_contact_set_sums(
+        (mis_pmt_matrix, syn_pmt_matrix), cs_sites_list
+    )
+    mis_pmt_means, mis_pmt_sds = seq_utils.get_mean_and_sd(mis_pmt_sums)
+    syn_pmt_means, syn_pmt_sds = seq_utils.get_mean_and_sd(syn_pmt_sums)
+
+    for k, (i, a, pdb_pos, pdb_aa, contacts_pdb_pos, all_uniprot_pos) \
+            in enumerate(contact_sets):
+        seq_seps = ';'.join(str(x) for x in
+                            [pdb_to_uniprot_mapping[c] - i for c in contacts_pdb_pos])
+        num_contacts = len(contacts_pdb_pos)
 
-            chain = pdb_utils.get_pdb_chain(
-                pdb_id, pdb_chain, configs['pdb_dir'], 'mmCif'
+        # get sequence context of the contact set
+        try:
+            seq_context = seq_utils.get_codon_seq_context(
+                [pdb_to_uniprot_mapping[x] for x in contacts_pdb_pos] + [i], cds
+            )
+        except IndexError:
+            logging.critical(
+                'Error in retrieving sequence context:', 
+                contacts_pdb_pos, right_enst, uniprot_id
             )
+            break
 
-            if chain is None:
-                print('No chain was available for %s' % uniprot_id)
-                continue
-            
-            # get all contact pairs in the PDB structure
-            if args.multimer:
-                structure = pdb_utils.get_structure(pdb_id, configs['pdb_dir'], 'mmCif')
-                all_aa_residues = [aa for aa in structure.get_residues() if is_aa(aa, standard=True)]
-            else:
-                all_aa_residues = [aa for aa in chain.get_residues() if is_aa(aa, standard=True)]
-            all_contacts = pdb_utils.search_for_all_contacts(
-                all_aa_residues, radius=args.radius
+        # compute the GC content of the sequence context
+        if len(seq_context) == 0:
+            print('No nucleotides were found in sequence context!')
+            continue
+        gc_fraction = seq_utils.gc_content(seq_context)
+
+        if contacts_pdb_pos:
+            # count the total # observed and expected variants
+            # in the contact set
+            cs_sites = np.array(cs_sites_list[k], dtype=np.intp)
+            total_missense_obs = int(mis_count_arr[cs_sites].sum())
+            total_synonymous_obs = int(syn_count_arr[cs_sites].sum())
+            mis_var_sites = int(mis_var_arr[cs_sites].sum())
+            syn_var_sites = int(syn_var_arr[cs_sites].sum())
+            total_missense_poss, total_synonyms_poss = \
+                cds_ns_counts_arr[cs_sites - 1].sum(axis=0)
+            total_missense_sites, total_synonymous_sites = \
+                cds_ns_sites_arr[cs_sites - 1].sum(axis=0)
+            total_synonymous_rate, total_missense_rate = \
+                codon_rates_arr[cs_sites - 1].sum(axis=0)
+
+            # get permutation statistics
+            mis_pmt_mean = mis_pmt_means[k]
+            mis_pmt_sd = mis_pmt_sds[k]
+            mis_p_value = (
+                np.sum(mis_pmt_sums[k] <= total_missense_obs) + 1
+            ) / 10001
+            syn_pmt_mean = syn_pmt_means[k]
+            syn_pmt_sd = syn_pmt_sds[k]
+            syn_p_value = (
+                np.sum(syn_pmt_sums[k] <= total_synonymous_obs) + 1
+            ) / 10001
+
+            # push results for the current residue
+            cosmis.append(
+                id_fields + 
+                [i, a, pdb_pos, pdb_aa] + 
+                [pdb_id, pdb_chain] + 
+                [
+                    seq_seps, 
+                    num_contacts + 1,
+                    syn_var_sites, 
+                    total_synonymous_sites,
+                    mis_var_sites, 
+                    total_missense_sites,
+                    total_synonyms_poss,
+                    total_missense_poss,
+                    gc_fraction,
+                    total_synonymous_rate,
+                    total_synonymous_obs, 
+                    total_missense_rate,
+                    total_missense_obs,
+                    mis_pmt_mean,
+                    mis_pmt_sd,
+                    mis_p_value,
+                    syn_pmt_mean,
+                    syn_pmt_sd,
+                    syn_p_value,
+                    enst_mp_counts[right_enst][2],
+                    enst_mp_counts[right_enst][4],
+                    total_exp_syn_counts,
+                    total_exp_mis_counts,
+                    len(pep_seq),
+                    (total_missense_obs - mis_pmt_mean) / mis_pmt_sd
+                ]
             )
+        else:
+            print("No contacts found.")
+            continue
 
-            # index all contacts by residue ID
-            indexed_contacts = defaultdict(list)
-            for c in all_contacts:
-                indexed_contacts[c.get_res_a()].append(c.get_res_b())
-                indexed_contacts[c.get_res_b()].append(c.get_res_a())
+    io_utils.write_table(
+        cosmis, get_dataset_headers(), cosmis_file, sci_columns=SCI_COLUMNS,
+        raw_columns=RAW_COLUMNS
+    )
 
-            # one-to-one mapping between UniProt residues and PDB residues
-            # used later in determining count of variants in contact set
-            uniprot_to_pdb_mapping = sifts_residue_mapping.uniprot_to_pdb(
-                uniprot_id, pdb_id, pdb_chain
-            )
-            pdb_to_uniprot_mapping = {v: k for k, v in uniprot_to_pdb_mapping.items()}
-            if uniprot_to_pdb_mapping is None or pdb_to_uniprot_mapping is None:
-                print('Mapping between UniProt and PDB failed! Skipped!')
-                continue
 
-            # row identifier for each COSMIS score record
-            id_fields = [uniprot_id, right_enst]
-            
-            for i, a in enumerate(pep_seq, start=1):
-                # @TODO need to get the corresponding position in the PDB file
-                # It is highly likely that the amino acid at position i in the
-                # PDB file will not be the same amino acid at position i in the
-                # ENSP peptide sequence
-                try:
-                    pdb_pos = uniprot_to_pdb_mapping[i]
-                    res = chain[pdb_pos]
-                except KeyError:
-                    logging.critical(
-                        'Residue %s in %s not found in chain %s in PDB file: %s', 
-                        i, uniprot_id, pdb_chain, pdb_id
-                    )
-                    continue
-                    
-                # check that the amino acid in ENSP sequence matches 
-                # that in the PDB structure
-                pdb_aa = seq1(res.get_resname())
-                if a != pdb_aa:
-                    logging.critical(
-                        'Residue in %s did not match that in PDB %s '
-                        'chain %s at %s: %s vs %s',
-                        uniprot_id, pdb_id, pdb_chain, i, a, pdb_aa
-                    )
-                    continue
-
-                contact_res = indexed_contacts[res]
-                # only consider contacts within the same protein
-                contacts_pdb_pos = [
-                    r.get_id()[1] for r in contact_res if r.get_id()[1] in pdb_to_uniprot_mapping.keys()
-                ]
-                seq_seps = ';'.join(str(x) for x in
-                                    [pdb_to_uniprot_mapping[c] - i for c in contacts_pdb_pos])
-                num_contacts = len(contacts_pdb_pos)
-
-                total_missense_obs = missense_counts.setdefault(i, 0)
-                total_synonymous_obs = synonymous_counts.setdefault(i, 0)
-                mis_var_sites = site_variability_missense.setdefault(i, 0)
-                syn_var_sites = site_variability_synonymous.setdefault(i, 0)
-                total_missense_poss = all_cds_ns_counts[i - 1][0]
-                total_synonyms_poss = all_cds_ns_counts[i - 1][1]
-                total_missense_sites = all_cds_ns_sites[i - 1][0]
-                total_synonymous_sites = all_cds_ns_sites[i - 1][1]
-                total_synonymous_rate = codon_mutation_rates[i - 1][0]
-                total_missense_rate = codon_mutation_rates[i - 1][1]
-
-                # get sequence context of the contact set
-                try:
-                    seq_context = seq_utils.get_codon_seq_context(
-                        [pdb_to_uniprot_mapping[x] for x in contacts_pdb_pos] + [i], cds
-                    )
-                except IndexError:
-                    logging.critical(
-                        'Error in retrieving sequence context:', 
-                        contacts_pdb_pos, right_enst, uniprot_id
-                    )
-                    break
-
-                # compute the GC content of the sequence context
-                if len(seq_context) == 0:
-                    print('No nucleotides were found in sequence context!')
-                    continue
-                gc_fraction = seq_utils.gc_content(seq_context)
-
-                if contacts_pdb_pos:
-                    all_uniprot_pos = []
-                    for j in contacts_pdb_pos:
-                        # @TODO need to get the corresponding position in ENSP
-                        # amino acid sequence using the SIFTS mapping table
-                        try:
-                            uniprot_pos = pdb_to_uniprot_mapping[j]
-                        except KeyError:
-                            logging.critical(
-                                'PDB residue %s in %s chain %s not found '
-                                'in %s, skipped',
-                                j, pdb_id, pdb_chain, uniprot_id
-                            )
-                            continue
-
-                        # count the total # observed variants in contacting residues
-                        total_missense_obs += missense_counts.setdefault(uniprot_pos, 0)
-                        total_synonymous_obs += synonymous_counts.setdefault(uniprot_pos, 0)
-                        mis_var_sites += site_variability_missense.setdefault(uniprot_pos, 0)
-                        syn_var_sites += site_variability_synonymous.setdefault(uniprot_pos, 0)
-                        # count the total # expected variants
-                        try:
-                            total_missense_poss += all_cds_ns_counts[uniprot_pos - 1][0]
-                            total_synonyms_poss += all_cds_ns_counts[uniprot_pos - 1][1]
-                            total_missense_sites += all_cds_ns_sites[uniprot_pos - 1][0]
-                            total_synonymous_sites += all_cds_ns_sites[uniprot_pos - 1][1]
-                            total_synonymous_rate += codon_mutation_rates[uniprot_pos - 1][0]
-                            total_missense_rate += codon_mutation_rates[uniprot_pos - 1][1]
-                        except IndexError:
-                            logging.critical(
-                                'PDB residue %s in %s chain %s out of the range '
-                                'of %s codons, something must be wrong with SIFTS mapping',
-                                j, pdb_id, pdb_chain, right_enst
-                            )
-                            continue
-                        all_uniprot_pos.append(uniprot_pos)
-
-                    # get permutation statistics
-                    mis_pmt_mean, mis_pmt_sd, mis_p_value = seq_utils.get_permutation_stats(
-                        mis_pmt_matrix, all_uniprot_pos + [i], total_missense_obs
-                    )
-                    syn_pmt_mean, syn_pmt_sd, syn_p_value = seq_utils.get_permutation_stats(
-                        syn_pmt_matrix, all_uniprot_pos + [i], total_synonymous_obs
-                    )
-
-                    # push results for the current residue
-                    cosmis.append(
-                        id_fields + 
-                        [i, a, pdb_pos, pdb_aa] + 
-                        [pdb_id, pdb_chain] + 
-                        [
-                            seq_seps, 
-                            num_contacts + 1,
-                            syn_var_sites, 
-                            '{:.3f}'.format(total_synonymous_sites),
-                            mis_var_sites, 
-                            '{:.3f}'.format(total_missense_sites),
-                            total_synonyms_poss,
-                            total_missense_poss,
-                            '{:.3f}'.format(gc_fraction),
-                            '{:.3e}'.format(total_synonymous_rate),
-                            total_synonymous_obs, 
-                            '{:.3e}'.format(total_missense_rate),
-                            total_missense_obs,
-                            '{:.3f}'.format(mis_pmt_mean),
-                            '{:.3f}'.format(mis_pmt_sd),
-                            '{:.3e}'.format(mis_p_value),
-                            '{:.3f}'.format(syn_pmt_mean),
-                            '{:.3f}'.format(syn_pmt_sd),
-                            '{:.3e}'.format(syn_p_value),
-                            enst_mp_counts[right_enst][2],
-                            enst_mp_counts[right_enst][4],
-                            total_exp_syn_counts,
-                            total_exp_mis_counts,
-                            len(pep_seq),
-                            '{:.3f}'.format((total_missense_obs - mis_pmt_mean) / mis_pmt_sd)
-                        ]
-                    )
-                else:
-                    print("No contacts found.")
-                    continue
-
-            with open(file=cosmis_file, mode='wt') as opf:
-                header = get_dataset_headers()
-                csv_writer = csv.writer(opf, delimiter='\t')
-                csv_writer.writerow(header)
-                csv_writer.writerows(cosmis)
+def main():
+    # parse command-line arguments
+    args = parse_cmd()
+
+    # configure the logging system
+    logging.basicConfig(
+        filename=args.log,
+        level=logging.INFO,
+        filemode='w',
+        format='%(levelname)s:%(asctime)s:%(message)s'
+    )
+
+    # parse configuration file
+    configs = parse_config(args.config)
+    logging.info('Supplied configuration:')
+    logging.info(json.dumps(configs, sort_keys=True, indent=4))
+
+    # compute the COSMIS scores for each transcript
+    with open(args.uniprot_ids, 'rt') as ipf:
+        uniprot_ids = [line.strip() for line in ipf]
+
+    if args.nprocs > 1:
+        if 'fork' in multiprocessing.get_all_start_methods():
+            # forked workers inherit the databases loaded here, whereas
+            # spawned ones, the default on macOS, would each be sent a
+            # pickled copy of them
+            context = multiprocessing.get_context('fork')
+            initializer = init_worker
+            initargs = (load_datasets(args, configs),)
+        else:
+            # without fork, every worker loads the databases by itself
+            context = multiprocessing.get_context()
+            initializer = load_worker_datasets
+            initargs = (args, configs)
+        with context.Pool(
+            args.nprocs, initializer=initializer, initargs=initargs
+        ) as pool:
+            for _ in pool.imap_unordered(
+                compute_cosmis, uniprot_ids, chunksize=4
+            ):
+                pass
+    else:
+        init_worker(load_datasets(args, configs))
+        for uniprot_id in uniprot_ids:
+            compute_cosmis(uniprot_id)
 
 
 if __name__ == '__main__':
@@ -1,11 +1,9 @@
 #!/usr/bin/env python3
 
 import os
-import pandas as pd
 import urllib
 from cosmis.mapping.sifts import SIFTS
-from cosmis.utils import pdb_utils
-from collections import defaultdict
+from cosmis.utils import io_utils, pdb_utils
 
 
 SIFTS_ENSEMBL_URL = 'ftp://ftp.ebi.ac.uk/pub/databases/msd/sifts/flatfiles/' \
@@ -42,6 +40,15 @@ class EnsemblUniProtPDB:
         self.sifts_uniprot = sifts_uniprot
         self.pdb_path = pdb_path
 
+        # row positions of the mapping table grouped by column values, built
+        # on first use by _select
+        self._row_indices = {}
+
+        # residue-level SIFTS mapping shared by all queries, loaded on first
+        # use by _get_residue_mapping
+        self._sifts = None
+        self._residue_mappings = {}
+
     def _create_mapping_table(self, sifts_mapping_file):
         """
 
@@ -54,14 +61,8 @@ class EnsemblUniProtPDB:
 
         """
         # load the mapping file into a Pandas DataFrame
-        sifts_table = pd.read_csv(
-            sifts_mapping_file,
-            sep='\t',
-            compression='gzip',
-            comment='#',
-            na_values='None',
-            low_memory=False
-        )
+        # the parsed table is cached next to the mapping file
+        sifts_table = io_utils.load_cached(sifts_mapping_file, io_utils.read_gz_table)
 
         sifts_table.rename(
             inplace=True,
@@ -78,6 +79,82 @@ class EnsemblUniProtPDB:
 
         return sifts_table
 
+    def _select(self, column, value):
+        """
+        Select the rows of the mapping table in which the given column equals
+        the given value through a hashed index instead of a full table scan.
+
+        Parameters
+        ----------
+        column : str
+            Name of the column, e.g. 'enst_id' or 'uniprot_id'.
+        value : str
+            Value to look up.
+
+        Returns
+        -------
+        DataFrame
+            Matching rows in the order of the mapping table.
+
+        """
+        if column not in self._row_indices:
+            self._row_indices[column] = self.mapping_table.groupby(
+                column, sort=False
+            ).indices
+        rows = self._row_indices[column].get(value, [])
+        return self.mapping_table.iloc[rows]
+
+    @staticmethod
+    def _get_pdb_chains(hits):
+        """
+        Distinct PDB chains among the given rows of the mapping table.
+
+        Parameters
+        ----------
+        hits : DataFrame
+            Rows of the mapping table.
+
+        Returns
+        -------
+        DataFrame
+            The distinct pairs of PDB ID and chain ID in order of first
+            appearance, skipping those where either of them is missing.
+
+        """
+        pdb_chains = hits[['pdb_id', 'pdb_chain']].dropna()
+        pdb_chains = pdb_chains[
+            (pdb_chains['pdb_id'] != '') & (pdb_chains['pdb_chain'] != '')
+        ]
+        return pdb_chains.drop_duplicates()
+
+    def _get_residue_mapping(self, pdb_id, pdb_chain, uniprot_id=None):
+        """
+        Residue-level mapping from the given PDB chain to UniProt, memoized
+        as the same chain is usually a candidate for many queries.
+
+        Parameters
+        ----------
+        pdb_id : str
+        pdb_chain : str
+        uniprot_id : str, optional (default: None)
+
+        Returns
+        -------
+        dict
+            See SIFTS.pdb_to_uniprot.
+
+        """
+        key = (pdb_id, pdb_chain, uniprot_id)
+        if key not in self._residue_mappings:
+            if self._sifts is None:
+                self._sifts = SIFTS(
+                    sifts_uniprot=self.sifts_uniprot, xml_dir=self.pdb_path
+                )
+            self._residue_mappings[key] = self._sifts.pdb_to_uniprot(
+                pdb_id, pdb_chain, uniprot_id
+            )
+        return self._residue_mappings[key]
+
     def enst_to_pdb(self, enst_id, uniprot_id=None):
         """
 
@@ -91,27 +168,22 @@ class EnsemblUniProtPDB:
 
         """
         enst_id = enst_id.upper()
-        query_str = 'enst_id == ' + '"' + enst_id + '"'
-
-        if uniprot_id is not None:
-            query_str += ' and uniprot_id == ' + '"' + uniprot_id + '"'
 
         # query the mapping table
-        hits = self.mapping_table.query(query_str)
+        hits = self._select('enst_id', enst_id)
+        if uniprot_id is not None:
+            hits = hits[hits['uniprot_id'] == uniprot_id]
 
         if hits.empty:
             return None, None
 
-        pdb_chains = defaultdict(list)
-        for _, r in hits.iterrows():
-            # skip records where PDB ID or CHAIN ID is empty string
-            if r['pdb_id'] and r['pdb_chain']:
-                pdb_chains[r['pdb_id']].append(r['pdb_chain'])
-
-        # remove duplicates but keep ordering
-        uniq_pdb_chains = []
-        for k, v in pdb_chains.items():
-            uniq_pdb_chains.append((k, v[0]))
+        # the first chain of each PDB entry, keeping the ordering
+        pdb_chains = self._get_pdb_chains(hits)
+        uniq_pdb_chains = list(
+            pdb_chains.drop_duplicates('pdb_id').itertuples(
+                index=False, name=None
+            )
+        )
 
         if not uniq_pdb_chains:
             return None, None
@@ -119,7 +191,6 @@ class EnsemblUniProtPDB:
         # return the pdb chain that has the largest coverage
         # of the transcript protein sequence, this could be implemented
         # ad hoc, but for now, we rely on SIFTS residue-level mapping
-        sifts = SIFTS(sifts_uniprot=self.sifts_uniprot, xml_dir=self.pdb_path)
         max_len = 0
         best_resolution = pdb_utils.get_resolution(uniq_pdb_chains[0][0], self.pdb_path)
         best_pdb_id = ''
@@ -128,7 +199,7 @@ class EnsemblUniProtPDB:
             if not (pdb_id and chain_id):
                 print('PDB ID is empty string for', enst_id, ', skipped')
                 continue
-            residue_mapping = sifts.pdb_to_uniprot(pdb_id, chain_id)
+            residue_mapping = self._get_residue_mapping(pdb_id, chain_id)
             if residue_mapping is None:
                 print('Failed to obtained residue mapping from SIFTS xml file.')
                 continue
@@ -161,9 +232,8 @@ class EnsemblUniProtPDB:
 
         """
         enst_id = enst_id.upper()
-        query_str = 'enst_id == ' + '"' + enst_id + '"'
-        hits = self.mapping_table.query(query_str)
-        return set(hits.unique())
+        hits = self._select('enst_id', enst_id)
+        return set(hits['uniprot_id'].unique())
 
     def uniprot_to_pdb(self, uniprot_id, multimeric_state=0):
         """
@@ -177,39 +247,31 @@ class EnsemblUniProtPDB:
 
         """
         uniprot_id = uniprot_id.upper()
-        query_str = 'uniprot_id == ' + '"' + uniprot_id + '"'
 
         # query the mapping table
-        hits = self.mapping_table.query(query_str)
+        hits = self._select('uniprot_id', uniprot_id)
 
         if hits.empty:
             return None, None
 
-        pdb_chains = defaultdict(set)
-        for _, r in hits.iterrows():
-            # skip records where PDB ID or CHAIN ID is empty string
-            if r['pdb_id'] and r['pdb_chain']:
-                pdb_chains[r['pdb_id']].add(r['pdb_chain'])
+        pdb_chains = self._get_pdb_chains(hits)
+        num_chains = pdb_chains['pdb_id'].value_counts()
 
         uniq_pdb_chains = []
-        for k, v in pdb_chains.items():
+        for k, v in pdb_chains.drop_duplicates('pdb_id').itertuples(
+                index=False, name=None):
             if multimeric_state:
-                if len(v) != multimeric_state:
+                if num_chains[k] != multimeric_state:
                     continue
 
                 # make sure that the PDB file has exactly multimeric_state
                 # number of chains
-                query_by_pdb = 'pdb_id == ' + '"' + k + '"'
-                pdb_hits = self.mapping_table.query(query_by_pdb)
-                chain_records = set()
-                for _, x in pdb_hits.iterrows():
-                    if x['pdb_id'] and x['pdb_chain']:
-                        chain_records.add(x['pdb_id'] + x['pdb_chain'])
-                if len(chain_records) != multimeric_state:
+                pdb_hits = self._select('pdb_id', k)
+                if len(self._get_pdb_chains(pdb_hits)) != multimeric_state:
                     continue
 
             # remove duplicates but keep ordering
-            uniq_pdb_chains.append((k, list(v)[0]))
+            uniq_pdb_chains.append((k, v))
 
         if not uniq_pdb_chains:
             return None, None
@@ -217,7 +279,6 @@ class EnsemblUniProtPDB:
         # return the pdb chain that has the largest coverage
         # of the transcript protein sequence, this could be implemented
         # ad hoc, but for now, we rely on SIFTS residue-level mapping
-        sifts = SIFTS(sifts_uniprot=self.sifts_uniprot, xml_dir=self.pdb_path)
         max_len = 0
         best_resolution = 5.0
         best_pdb_id = ''
@@ -235,7 +296,9 @@ class EnsemblUniProtPDB:
             if resolution is not None and resolution > 5.0:
                 print('{} {} resolution > 5 angstrom. EXCLUDED!'.format(pdb_id, chain_id))
                 continue
-            residue_mapping = sifts.pdb_to_uniprot(pdb_id, chain_id, uniprot_id)
+            residue_mapping = self._get_residue_mapping(
+                pdb_id, chain_id, uniprot_id
+            )
             if residue_mapping is None:
                 print('Failed to obtain residue mapping from SIFTS xml file.')
                 continue
@@ -8,6 +8,7 @@ import urllib
 import wget
 import signal
 import xml.etree.ElementTree as ET
+from cosmis.utils import io_utils
 
 
 SIFTS_URL = 'ftp://ftp.ebi.ac.uk/pub/databases/msd/sifts/flatfiles/tsv/' \
@@ -112,6 +113,10 @@ class SIFTS:
                 sifts_uniprot = local_path
         
         self.sifts_table = self._create_mapping_table(sifts_uniprot)
+
+        # row positions of the mapping table grouped by column values, built
+        # on first use by _select
+        self._row_indices = {}
         
         if xml_dir is None:
             self.xml_dir = os.path.abspath('/tmp/')
@@ -130,14 +135,8 @@ class SIFTS:
         -------
 
         """
-        sifts_table = pd.read_csv(
-            sifts_uniprot,
-            sep='\t',
-            comment='#',
-            compression='gzip',
-            na_values='None',
-            low_memory=False
-        )
+        # the parsed table is cached next to the mapping file
+        sifts_table = io_utils.load_cached(sifts_uniprot, io_utils.read_gz_table)
 
         sifts_table.rename(
             inplace=True,
@@ -156,6 +155,31 @@ class SIFTS:
 
         return sifts_table
 
+    def _select(self, column, value):
+        """
+        Select the rows of the mapping table in which the given column equals
+        the given value through a hashed index instead of a full table scan.
+
+        Parameters
+        ----------
+        column : str
+            Name of the column, e.g. 'pdb_id' or 'uniprot_id'.
+        value : str
+            Value to look up.
+
+        Returns
+        -------
+        DataFrame
+            Matching rows in the order of the mapping table.
+
+        """
+        if column not in self._row_indices:
+            self._row_indices[column] = self.sifts_table.groupby(
+                column, sort=False
+            ).indices
+        rows = self._row_indices[column].get(value, [])
+        return self.sifts_table.iloc[rows]
+
     def pdb_to_uniprot(self, pdb_id, pdb_chain=None, uniprot_id=None):
         """
 
@@ -173,17 +197,15 @@ class SIFTS:
 
         """
         pdb_id = pdb_id.lower()
-        query_str = 'pdb_id == ' + '"' + pdb_id + '"'
+        hits = self._select('pdb_id', pdb_id)
 
         # filter by PDB chain
         if pdb_chain is not None:
-            query_str += ' and pdb_chain == ' + '"' + pdb_chain + '"'
+            hits = hits[hits['pdb_chain'] == pdb_chain]
 
         # filter by UniProt ID
         if uniprot_id is not None:
-            query_str += ' and uniprot_id == ' + '"' + uniprot_id + '"'
-
-        hits = self.sifts_table.query(query_str)
+            hits = hits[hits['uniprot_id'] == uniprot_id]
 
         # create position mapping from PDB to UniProt
         mapping = {}
@@ -227,20 +249,18 @@ class SIFTS:
         -------
 
         """
-        # construct the query string
         uniprot_id = uniprot_id.upper()
-        query_str = 'uniprot_id == ' + '"' + uniprot_id + '"'
+        hits = self._select('uniprot_id', uniprot_id)
 
         if pdb_id is not None and pdb_chain is not None:
             reduce_chains = False
             pdb_id = pdb_id.lower()
-            query_str += ' and pdb_id == ' + '"' + pdb_id + '"' + \
-                         ' and pdb_chain == ' + '"' + pdb_chain + '"'
+            hits = hits[
+                (hits['pdb_id'] == pdb_id) & (hits['pdb_chain'] == pdb_chain)
+            ]
         else:
             reduce_chains = True
 
-        hits = self.sifts_table.query(query_str)
-
         # only retain one chain if this option is set to True
         # @TODO this chunk needs to be revisited to make sure that all the
         # segments of the chain are retained
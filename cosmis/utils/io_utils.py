@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+
+import gzip
+import io
+import json
+import os
+import pickle
+import shutil
+import subprocess
+import tempfile
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+# optional faster gzip decompressors, the standard library gzip module is
+# used if neither of them is installed
+try:
+    from xopen import xopen
+except ImportError:
+    xopen = None
+
+try:
+    from isal import igzip
+except ImportError:
+    igzip = None
+
+# optional faster JSON parser, the standard library json module is used if it
+# is not installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# optional multi-threaded CSV reader, pandas is used if it is not installed
+try:
+    from pyarrow import csv as pa_csv
+except ImportError:
+    pa_csv = None
+
+
+# size of the read buffer placed on top of decompressed streams
+BUFFER_SIZE = 128 * 1024
+
+# size of the write buffer of output tables, large enough that a typical
+# table is written with a few write calls
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# keyword of DataFrame.to_csv that sets the line terminator, which pandas
+# renamed from line_terminator to lineterminator in version 1.5
+if tuple(int(x) for x in pd.__version__.split('.')[:2]) >= (1, 5):
+    LINE_TERMINATOR_KEYWORD = 'lineterminator'
+else:
+    LINE_TERMINATOR_KEYWORD = 'line_terminator'
+
+
+class PipedReader(io.BufferedReader):
+    """
+    Buffered reader of the standard output of a subprocess, which is waited
+    for when the reader is closed.
+    """
+    def __init__(self, process, buffer_size=BUFFER_SIZE):
+        """
+
+        Parameters
+        ----------
+        process : subprocess.Popen
+            A process started with stdout=subprocess.PIPE and bufsize=0.
+        buffer_size : int
+            Size of the read buffer.
+        """
+        super().__init__(process.stdout, buffer_size=buffer_size)
+        self._process = process
+
+    def close(self):
+        if self.closed:
+            return
+        # the process fails writing to a closed pipe if not all of its
+        # output was read, which is not an error of the process
+        read_to_end = not self.peek(1)
+        super().close()
+        returncode = self._process.wait()
+        if read_to_end and returncode != 0:
+            raise OSError(
+                '{} exited with code {}'.format(self._process.args, returncode)
+            )
+
+
+def open_gz(path, mode='rt', threads=4):
+    """
+    Open a gzip compressed file for reading with the fastest decompressor
+    available: xopen (which delegates to pigz or igzip), a pigz subprocess,
+    the ISA-L accelerated igzip module, or the gzip module of the standard
+    library.
+
+    Parameters
+    ----------
+    path : str
+        Path to the gzip compressed file.
+    mode : str
+        Either 'rt' for text or 'rb' for binary mode.
+    threads : int
+        Number of decompression threads to be used by xopen or pigz, pigz is
+        not used if this is 0.
+
+    Returns
+    -------
+    file object
+        A readable file object of the decompressed content.
+
+    """
+    if xopen is not None:
+        return xopen(path, mode, threads=threads)
+
+    pigz = shutil.which('pigz') if threads > 0 else None
+    if pigz is not None:
+        # decompression runs in parallel to the parsing of its output
+        process = subprocess.Popen(
+            [pigz, '-dc', '-p', str(threads), path],
+            stdout=subprocess.PIPE, bufsize=0
+        )
+        buffered = PipedReader(process)
+    else:
+        if igzip is not None:
+            raw = igzip.open(path, 'rb')
+        else:
+            raw = gzip.open(path, 'rb')
+        buffered = io.BufferedReader(raw, buffer_size=BUFFER_SIZE)
+    if 'b' in mode:
+        return buffered
+    return io.TextIOWrapper(buffered)
+
+
+def load_cached(source_file, loader, suffix='.pkl'):
+    """
+    Load the object parsed from the given file, using a pickled copy stored
+    next to the file if that copy is newer than the file itself. Otherwise,
+    the file is parsed with the given loader and the pickled copy is
+    (re)created.
+
+    Parameters
+    ----------
+    source_file : str
+        Path to the file to be parsed.
+    loader : callable
+        A function that takes the path to the file and returns the parsed
+        object.
+    suffix : str
+        Suffix appended to the path of the file to name the pickled copy.
+
+    Returns
+    -------
+    object
+        The object returned by the loader.
+
+    """
+    cache_file = source_file + suffix
+    if os.path.exists(cache_file) and \
+            os.path.getmtime(cache_file) >= os.path.getmtime(source_file):
+        try:
+            with open(cache_file, 'rb') as ipf:
+                return pickle.load(ipf)
+        except Exception:
+            # a truncated or corrupted cache, or one pickled by other
+            # versions of the libraries, is rebuilt from the file
+            print('Unable to read cache file', cache_file)
+
+    parsed = loader(source_file)
+    # write to a temporary file of its own first so that neither an
+    # interrupted run nor concurrent writers leave a truncated cache behind
+    tmp_file = None
+    try:
+        fd, tmp_file = tempfile.mkstemp(
+            dir=os.path.dirname(cache_file) or os.curdir
+        )
+        with os.fdopen(fd, 'wb') as opf:
+            pickle.dump(parsed, opf, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        print('Unable to write cache file', cache_file)
+        if tmp_file is not None and os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return parsed
+
+
+def load_json(path):
+    """
+    Parse a JSON file, gzip compressed if its name ends with '.gz', with
+    orjson if it is installed. Documents that orjson rejects, e.g. those with
+    NaN or Infinity literals, are parsed with the json module.
+
+    Parameters
+    ----------
+    path : str
+        Path to the JSON file.
+
+    Returns
+    -------
+    object
+        The parsed JSON document.
+
+    """
+    if path.endswith('.gz'):
+        with open_gz(path, 'rb') as ipf:
+            content = ipf.read()
+    else:
+        with open(path, 'rb') as ipf:
+            content = ipf.read()
+    if orjson is not None:
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(content)
+
+
+class PickledDict(Mapping):
+    """
+    A read-only dictionary whose values are kept pickled and only unpickled
+    when they are first accessed.
+    """
+    def __init__(self, pickled_values):
+        """
+
+        Parameters
+        ----------
+        pickled_values : dict
+            A dictionary that maps keys to pickled values.
+        """
+        self._pickled_values = pickled_values
+        self._values = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            value = pickle.loads(self._pickled_values[key])
+            self._values[key] = value
+            return value
+
+    def __contains__(self, key):
+        return key in self._pickled_values
+
+    def __iter__(self):
+        return iter(self._pickled_values)
+
+    def __len__(self):
+        return len(self._pickled_values)
+
+
+def load_lazy_json(path):
+    """
+    Load a JSON object keyed by e.g. transcript IDs such that
+    only the entries that are actually accessed get decoded. The entries are
+    pickled one by one into a cache next to the JSON file the first time the
+    file is read.
+
+    Parameters
+    ----------
+    path : str
+        Path to the JSON file, see load_json.
+
+    Returns
+    -------
+    PickledDict
+        A read-only dictionary of the JSON object.
+
+    """
+    def parse(json_file):
+        return {
+            k: pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL)
+            for k, v in load_json(json_file).items()
+        }
+
+    return PickledDict(load_cached(path, parse, suffix='.lazy.pkl'))
+
+
+def fasta_to_dict(handle, key_function):
+    """
+    Read the records from a FASTA file handle into a dictionary. This is a
+    minimal replacement of SeqIO.to_dict(SeqIO.parse(...)) that scans the
+    whole content for record boundaries instead of parsing line by line.
+
+    Parameters
+    ----------
+    handle : file object
+        A FASTA file opened in text mode.
+    key_function : callable
+        A function that takes a record ID, i.e. the first word of the header
+        line, and returns the dictionary key of the record.
+
+    Returns
+    -------
+    dict
+        A dictionary that maps record keys to sequences as plain strings.
+
+    """
+    data = handle.read()
+    end = len(data)
+    sequences = {}
+    start = data.find('>')
+    while start != -1:
+        header_end = data.find('\n', start)
+        if header_end == -1:
+            header_end = end
+        next_start = data.find('\n>', header_end)
+        record_end = end if next_start == -1 else next_start
+        key = key_function(data[start + 1:header_end].split(maxsplit=1)[0])
+        if key in sequences:
+            raise ValueError('Duplicate key \'%s\'' % key)
+        sequences[key] = ''.join(data[header_end:record_end].split())
+        start = -1 if next_start == -1 else next_start + 1
+    return sequences
+
+
+def read_fasta(fasta_file, key_function):
+    """
+    Read the sequences in a gzip compressed FASTA file into a dictionary.
+    The parsed sequences are cached next to the FASTA file so that later
+    calls do not need to parse the FASTA file again.
+
+    Parameters
+    ----------
+    fasta_file : str
+        Path to the gzip compressed FASTA file.
+    key_function : callable
+        A function that takes a record ID and returns its dictionary key.
+
+    Returns
+    -------
+    dict
+        A dictionary that maps record keys to sequences as plain strings.
+
+    """
+    def parse(path):
+        with open_gz(path, 'rt') as ipf:
+            return fasta_to_dict(ipf, key_function)
+
+    # the key function is part of the cache name as it determines the keys
+    return load_cached(
+        fasta_file, parse, suffix='.' + key_function.__name__ + '.pkl'
+    )
+
+
+def read_gz_table(path, na_values=('None',)):
+    """
+    Read a gzip compressed tab-delimited table whose header may be preceded
+    by '#' comment lines, e.g. the SIFTS flat files, into a DataFrame. The
+    table is parsed by the multi-threaded pyarrow CSV reader if it is
+    installed, otherwise by pandas.
+
+    Parameters
+    ----------
+    path : str
+        Path to the gzip compressed table.
+    na_values : tuple
+        Strings recognized as missing values in addition to the defaults,
+        which are about the same for pyarrow and pandas.
+
+    Returns
+    -------
+    DataFrame
+        The parsed table.
+
+    """
+    if pa_csv is None:
+        with open_gz(path, 'rb') as ipf:
+            return pd.read_csv(
+                ipf,
+                sep='\t',
+                comment='#',
+                na_values=list(na_values),
+                low_memory=False
+            )
+
+    # pyarrow does not skip comment lines by itself
+    skip_rows = 0
+    with open_gz(path, 'rt') as ipf:
+        for line in ipf:
+            if not line.startswith('#'):
+                break
+            skip_rows += 1
+
+    null_values = pa_csv.ConvertOptions().null_values + list(na_values)
+    with open_gz(path, 'rb') as ipf:
+        table = pa_csv.read_csv(
+            ipf,
+            read_options=pa_csv.ReadOptions(skip_rows=skip_rows),
+            parse_options=pa_csv.ParseOptions(delimiter='\t'),
+            convert_options=pa_csv.ConvertOptions(
+                null_values=null_values, strings_can_be_null=True
+            )
+        )
+    return table.to_pandas()
+
+
+def write_table(
+        rows, header, output_file, sci_columns=(), int_columns=(),
+        raw_columns=(), na_rep='nan'
+    ):
+    """
+    Write records to a tab-delimited file. The formatting is done column by
+    column by pandas: floating point numbers are written with three decimal
+    places, or in scientific notation with three decimal places for the
+    columns in sci_columns. Values in raw_columns are written as str(value).
+
+    Parameters
+    ----------
+    rows : list
+        Records to be written, one list of field values per record.
+    header : list
+        Column names.
+    output_file : str
+        Path to the output file.
+    sci_columns : iterable
+        Names of the columns to be written in scientific notation.
+    int_columns : iterable
+        Names of integer columns that may contain missing values, which
+        would otherwise turn them into floating point columns.
+    raw_columns : iterable
+        Names of the columns to be written without rounding.
+    na_rep : str
+        String representation of missing values.
+
+    Returns
+    -------
+    None
+
+    """
+    table = pd.DataFrame(rows, columns=header)
+    for col in sci_columns:
+        values = table[col].to_numpy(dtype=np.float64)
+        formatted = np.char.mod('%.3e', values).astype(object)
+        formatted[np.isnan(values)] = None
+        table[col] = formatted
+    for col in int_columns:
+        table[col] = table[col].astype('Int64')
+    for col in raw_columns:
+        table[col] = [None if x is None else str(x) for x in table[col]]
+    with open(
+            output_file, 'wt', buffering=OUTPUT_BUFFER_SIZE, newline=''
+    ) as opf:
+        table.to_csv(
+            opf, sep='\t', index=False, float_format='%.3f', na_rep=na_rep,
+            **{LINE_TERMINATOR_KEYWORD: '\n'}
+        )
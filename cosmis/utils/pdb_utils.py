@@ -9,15 +9,35 @@
 """
 
 import os
+from functools import lru_cache
+
 import numpy as np
 from Bio.Seq import Seq
 from Bio.PDB import PDBParser, PDBList, PPBuilder
 from Bio.PDB import parse_pdb_header
-from Bio.PDB import NeighborSearch
+from Bio.PDB.kdtrees import KDTree
 from Bio.PDB import is_aa
 from Bio.PDB import MMCIFParser
+from Bio.Data import IUPACData
 from cosmis.pdb_struct.contact import Contact
 
+# bucket size of the KD tree used in contact searches, the Biopython default
+KDTREE_BUCKET_SIZE = 10
+
+# three-letter codes of the 20 standard amino acids, same as those accepted by
+# Bio.PDB.is_aa(residue, standard=True)
+AA3 = frozenset(k.upper() for k in IUPACData.protein_letters_3to1)
+
+# three-letter to one-letter amino acid codes, same as the translation done by
+# Bio.SeqUtils.seq1 without rebuilding the table on every call
+THREE_TO_ONE = {
+    k.upper(): v for k, v in IUPACData.protein_letters_3to1_extended.items()
+}
+THREE_TO_ONE['TER'] = '*'
+
+# number of PDB entries whose resolution is memoized by get_resolution
+RESOLUTION_CACHE_SIZE = 4096
+
 
 def get_pdb_chain(pdb_id, pdb_chain, pdb_db=None, pdb_format='pdb'):
     """
@@ -146,9 +166,12 @@ def get_chain_seq(chain):
     return chain_seq
 
 
+@lru_cache(maxsize=RESOLUTION_CACHE_SIZE)
 def get_resolution(pdb_id, pdb_path=None):
     """
     Get the resolution of the structure represented by the given PDB ID.
+    Results are memoized so that repeated queries of the same PDB entry do
+    not parse its mmCIF file again.
 
     Parameters
     ----------
@@ -191,49 +214,142 @@ def get_resolution(pdb_id, pdb_path=None):
         return None
 
 
-def search_for_all_contacts(residues, radius=8.0):
+def get_contact_atoms(residues):
     """
-    Search for all contacts in the given set of residues based on
-    distances between CB atoms.
+    Select the atom representing each residue in contact searches, i.e. CB
+    atoms, or CA atoms for glycines.
 
     Parameters
     ----------
     residues : list
         A list of Biopython Residue objects.
-    radius : float
-        The radius within which two residues are considered in contact.
 
     Returns
     -------
-    list
-        A list of Contact objects.
+    tuple
+        A list of the residues for which a representative atom was found and
+        an (N, 3) array of the coordinates of their representative atoms.
 
     """
-    atom_list = []
+    kept_residues = []
+    coords = []
     for r in residues:
         if r.get_resname() == 'GLY':
             try:
-                atom_list.append(r['CA'])
+                atom = r['CA']
             except KeyError:
                 print('No CA atom found for GLY:', r, 'skipped ...')
                 continue
         else:
             try:
-                atom_list.append(r['CB'])
+                atom = r['CB']
             except KeyError:
                 print('No CB atom found for:', r.get_resname(), 'skipped ...')
                 continue
             # atom_list += [a for a in r.get_atoms() if a.get_name()
             #               not in BACKBONE_ATOMS]
         # atom_list += [a for a in r.get_atoms()]
-    ns = NeighborSearch(atom_list)
+        kept_residues.append(r)
+        coords.append(atom.get_coord())
+    coords = np.array(coords, dtype=np.float64).reshape(-1, 3)
+    return kept_residues, coords
+
+
+def search_for_contact_pairs(residues, radius=8.0):
+    """
+    Search for all pairs of residues in contact based on distances between
+    CB atoms. The search is done on a KD tree built directly from the
+    coordinate array, without creating Atom or Residue level results.
+
+    Parameters
+    ----------
+    residues : list
+        A list of Biopython Residue objects.
+    radius : float
+        The radius within which two residues are considered in contact.
+
+    Returns
+    -------
+    tuple
+        A list of the residues for which a representative atom was found and
+        a (K, 2) integer array of indices into that list, one row per pair
+        of residues in contact, with i < j in each row and rows sorted.
+
+    """
+    kept_residues, coords = get_contact_atoms(residues)
+    if len(kept_residues) < 2:
+        return kept_residues, np.empty((0, 2), dtype=np.intp)
+
+    tree = KDTree(coords, KDTREE_BUCKET_SIZE)
+    neighbors = tree.neighbor_search(radius)
+    pairs = np.array(
+        [(n.index1, n.index2) for n in neighbors], dtype=np.intp
+    ).reshape(-1, 2)
+    pairs.sort(axis=1)
+    pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+    return kept_residues, pairs
+
+
+def search_for_all_contacts(residues, radius=8.0):
+    """
+    Search for all contacts in the given set of residues based on
+    distances between CB atoms.
+
+    Parameters
+    ----------
+    residues : list
+        A list of Biopython Residue objects.
+    radius : float
+        The radius within which two residues are considered in contact.
+
+    Returns
+    -------
+    list
+        A list of Contact objects.
+
+    """
+    kept_residues, pairs = search_for_contact_pairs(residues, radius)
     all_contacts = [
-        Contact(res_a=c[0], res_b=c[1])
-        for c in ns.search_all(radius, level='R')
+        Contact(res_a=kept_residues[i], res_b=kept_residues[j])
+        for i, j in pairs.tolist()
     ]
     return all_contacts
 
 
+def index_contact_positions(residues, radius=8.0):
+    """
+    Map each residue to the residue numbers of the residues it is in contact
+    with. Residues are keyed by their full ID, i.e. residue.get_full_id(),
+    so that residues of separately parsed copies of the same structure can
+    be looked up as well.
+
+    Parameters
+    ----------
+    residues : list
+        A list of Biopython Residue objects.
+    radius : float
+        The radius within which two residues are considered in contact.
+
+    Returns
+    -------
+    dict
+        A dictionary that maps the full ID of each residue to a list of the
+        residue numbers of its contacts.
+
+    """
+    kept_residues, pairs = search_for_contact_pairs(residues, radius)
+    positions = np.array([r.get_id()[1] for r in kept_residues], dtype=np.intp)
+
+    # list each contact in both directions and group them by residue
+    both = np.concatenate([pairs, pairs[:, ::-1]])
+    both = both[np.lexsort((both[:, 1], both[:, 0]))]
+    offsets = np.searchsorted(both[:, 0], np.arange(len(kept_residues) + 1))
+    contact_positions = np.split(positions[both[:, 1]], offsets[1:-1])
+    return {
+        r.get_full_id(): pos.tolist() for r, pos in zip(kept_residues, contact_positions)
+    }
+
+
 def compute_adjacency_matrix(model, cutoff):
     """
 
@@ -56,23 +56,24 @@ def main():
         pivotal_data = pickle.load(ipf)
         
     # read in queries
-    query_strs = []
+    uniprot_ids = []
+    positions = []
     with open(cmd_args.query, 'rt') as ipf:
         for l in ipf:
             x, y = l.strip().split(',')
-            query_strs.append(
-                'uniprot == ' + '"' + x + '" and position == "' + y + '"'
-            )
-            
-    # now query pivotal data
-    hits = []
-    for q in query_strs:
-        print('Now query', q, 'from Pivotal data.')
-        hit = pivotal_data.query(q)
-        hits.append(hit)
-        
-    # concatenate hits into a single data frame
-    hits_df = pd.concat(hits)
+            uniprot_ids.append(x)
+            positions.append(y)
+    query_df = pd.DataFrame({'uniprot': uniprot_ids, 'position': positions})
+    query_df['position'] = query_df['position'].astype(
+        pivotal_data['position'].dtype
+    )
+
+    # now query pivotal data, hits are in the order of the queries
+    print('Now query', len(query_df), 'positions from Pivotal data.')
+    hits_df = query_df.merge(
+        pivotal_data, on=['uniprot', 'position'], how='inner'
+    )
+    hits_df = hits_df[pivotal_data.columns]
     
     # now write hits to disk file
     with open(cmd_args.output, 'wt') as opf:
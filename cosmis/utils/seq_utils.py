@@ -4,6 +4,15 @@ from cosmis.utils.genetic_code import GENETIC_CODE
 from cosmis.mutation_rates.trinucleotide_context_rates import MUTATION_RATES_UNIQUE
 import numpy as np
 
+# number of permutations drawn at a time by permute_variants, which bounds the
+# size of the int64 array returned by np.random.multinomial
+PERMUTATION_BLOCK_SIZE = 1000
+
+# number of permutation matrix columns gathered at a time by
+# get_contact_set_sums, each block takes # permutations * 2 bytes per column,
+# e.g. 10 MB for 10000 int16 permutations
+CONTACT_SET_BLOCK_SIZE = 512
+
 
 def count_codon_ns(codon):
     """
@@ -529,7 +538,65 @@ def get_missense_sites(variants):
     return mis_sites
 
 
-def permute_variants(m, length, p=None, n=10000):
+def tabulate_variants(variants, length):
+    """
+    Tabulate the number of missense and synonymous variants at each amino
+    acid position.
+
+    Parameters
+    ----------
+    variants : list
+        A list of variant records whose first field is the variant
+        identifier, e.g. ['A123B', ac, an].
+    length : int
+        Length of the peptide sequence.
+
+    Returns
+    -------
+    tuple
+        Two integer arrays of size length + 1 indexed by amino acid position,
+        holding the number of missense and synonymous variants respectively.
+        Variants at positions beyond the given length are ignored.
+
+    """
+    vvs = [v[0] for v in variants]
+    positions = np.fromiter(
+        (int(vv[1:-1]) for vv in vvs), dtype=np.int64, count=len(vvs)
+    )
+    is_missense = np.fromiter(
+        (vv[0] != vv[-1] for vv in vvs), dtype=bool, count=len(vvs)
+    )
+    in_range = positions <= length
+    missense_counts = np.bincount(
+        positions[is_missense & in_range], minlength=length + 1
+    )
+    synonymous_counts = np.bincount(
+        positions[~is_missense & in_range], minlength=length + 1
+    )
+    return missense_counts.astype(np.int32), synonymous_counts.astype(np.int32)
+
+
+def get_permutation_dtype(m):
+    """
+    Smallest integer type that holds the permuted counts of m variants.
+
+    Parameters
+    ----------
+    m : int
+        Number of variants to be distributed in each permutation.
+
+    Returns
+    -------
+    numpy.dtype
+        int16, or int32 if m does not fit in int16.
+
+    """
+    if m <= np.iinfo(np.int16).max:
+        return np.dtype(np.int16)
+    return np.dtype(np.int32)
+
+
+def permute_variants(m, length, p=None, n=10000, out=None):
     """
     To be added ...
 
@@ -539,26 +606,112 @@ def permute_variants(m, length, p=None, n=10000):
     length
     p
     n
+    out : numpy.ndarray, optional
+        An (n, length) array to be filled with the permutations instead of
+        allocating a new one, e.g. a view from PermutationBuffer.
 
     Returns
     -------
+    numpy.ndarray
+        An (n, length) integer matrix, of type get_permutation_dtype(m)
+        unless out is given. Sums over it should be accumulated in int32.
 
     """
     if not (p is None) and length != len(p):
         raise ValueError(
             'Peptide length did not match probability length {} != {}'.format(length, len(p))
         )
+    if out is None:
+        out = np.empty((n, length), dtype=get_permutation_dtype(m))
+    elif out.shape != (n, length):
+        raise ValueError(
+            'Output array has shape {}, expected {}'.format(out.shape, (n, length))
+        )
+    elif m > np.iinfo(out.dtype).max:
+        raise ValueError(
+            'Output array of type {} cannot hold {} variants'.format(out.dtype, m)
+        )
     # normalize p
     if p is not None:
         p = p / np.sum(p)
-    missense_matrix = []
-    for _ in range(n):
-        v = np.zeros(length)
-        m_sites = np.random.choice(range(length), m, replace=True, p=p)
-        for s in m_sites:
-            v[s] += 1
-        missense_matrix.append(v)
-    return np.stack(missense_matrix)
+    else:
+        p = np.full(length, 1 / length)
+    # the variant counts of each permutation follow a multinomial
+    # distribution, so they are drawn directly instead of drawing the
+    # sites of the m variants one by one
+    for start in range(0, n, PERMUTATION_BLOCK_SIZE):
+        stop = min(start + PERMUTATION_BLOCK_SIZE, n)
+        out[start:stop] = np.random.multinomial(m, p, size=stop - start)
+    return out
+
+
+class PermutationBuffer:
+    """
+    Reusable storage of permutation matrices. Proteins processed one after
+    another in a loop get C-contiguous views of the same flat array, which
+    is only reallocated when a protein longer than all previous ones comes
+    along.
+    """
+    def __init__(self, n=10000):
+        """
+
+        Parameters
+        ----------
+        n : int
+            Number of permutations.
+        """
+        self._n = n
+        self._buffer = np.empty(0, dtype=np.int16)
+
+    def view(self, length, dtype=np.int16):
+        """
+
+        Parameters
+        ----------
+        length : int
+            Length of the peptide.
+        dtype : numpy.dtype
+            Type of the permuted counts, see get_permutation_dtype.
+
+        Returns
+        -------
+        numpy.ndarray
+            A C-contiguous (n, length) view of the buffer to be passed to
+            permute_variants as out.
+
+        """
+        size = self._n * length
+        if size > self._buffer.size or self._buffer.dtype != dtype:
+            self._buffer = np.empty(
+                max(size, self._buffer.size), dtype=dtype
+            )
+        view = self._buffer[:size].reshape(self._n, length)
+        assert view.flags.c_contiguous
+        return view
+
+
+def get_mean_and_sd(pmt_sums, axis=-1):
+    """
+    Mean and standard deviation of permuted variant counts, the deviations
+    being taken from the mean computed here instead of np.std computing the
+    mean again.
+
+    Parameters
+    ----------
+    pmt_sums : numpy.ndarray
+        Permuted variant counts summed over contact sets.
+    axis : int
+        Axis along which the permutations are laid out.
+
+    Returns
+    -------
+    tuple
+        The means and the standard deviations as float64.
+
+    """
+    pmt_mean = np.mean(pmt_sums, axis=axis, dtype=np.float64, keepdims=True)
+    pmt_sd = np.sqrt(np.mean(np.square(pmt_sums - pmt_mean), axis=axis))
+    return np.squeeze(pmt_mean, axis=axis)[()], pmt_sd
 
 
 def get_permutation_stats(pmt_matrix, cs_sites, n_obs):
@@ -576,20 +729,110 @@ def get_permutation_stats(pmt_matrix, cs_sites, n_obs):
     """
     if not isinstance(pmt_matrix, dict):
         contact_res_indices = [pos - 1 for pos in cs_sites]
-        pmt = pmt_matrix[:, contact_res_indices].sum(axis=1)
+        pmt = pmt_matrix[:, contact_res_indices].sum(axis=1, dtype=np.int32)
     else:
         pmt = 0
         for res in cs_sites:
             chain_id = res.get_full_id()[2]
             res_index = res.get_full_id()[3][1] - 1
-            pmt += pmt_matrix[chain_id][:, res_index]
-    pmt_mean = np.mean(pmt)
-    pmt_sd = np.std(pmt)
+            pmt = pmt + pmt_matrix[chain_id][:, res_index].astype(np.int32)
+    pmt_mean, pmt_sd = get_mean_and_sd(pmt)
     n = np.sum(pmt <= n_obs)
     p_value = (n + 1) / 10001
     return pmt_mean, pmt_sd, p_value
 
 
+def get_contact_set_sums(
+        pmt_matrix, cs_sites_list, block_size=CONTACT_SET_BLOCK_SIZE
+    ):
+    """
+    Sum the permuted variant counts over each of the given contact sets.
+
+    The columns of all contact sets are gathered in blocks and reduced set
+    by set with sum_over_contact_sets, so that the permuted counts stay in
+    their integer type and only a block of columns is copied at a time.
+    Several permutation matrices of the same peptide, e.g. the missense and
+    the synonymous one, can be reduced against the same blocks.
+
+    Parameters
+    ----------
+    pmt_matrix : numpy.ndarray or tuple
+        Permutation matrix of shape (# permutations, peptide length), or a
+        tuple of such matrices.
+    cs_sites_list : list
+        A list of non-empty contact sets, each being a list of 1-based
+        positions.
+    block_size : int
+        Approximate number of columns gathered at a time, each block holds
+        at least one contact set.
+
+    Returns
+    -------
+    numpy.ndarray or tuple
+        An int32 matrix of shape (# contact sets, # permutations) whose k-th
+        row holds the permuted variant counts summed over the k-th contact
+        set, or a tuple of such matrices if a tuple of matrices was given.
+
+    """
+    if isinstance(pmt_matrix, tuple):
+        pmt_matrices = pmt_matrix
+    else:
+        pmt_matrices = (pmt_matrix,)
+    pmt_sums = tuple(
+        np.empty((len(cs_sites_list), x.shape[0]), dtype=np.int32)
+        for x in pmt_matrices
+    )
+    cs_indices_list = [np.asarray(x, dtype=np.intp) - 1 for x in cs_sites_list]
+    ends = np.cumsum([len(x) for x in cs_indices_list])
+    start = 0
+    while start < len(cs_indices_list):
+        first_column = ends[start] - len(cs_indices_list[start])
+        stop = max(
+            start + 1,
+            int(np.searchsorted(ends, first_column + block_size, side='right'))
+        )
+        block = cs_indices_list[start:stop]
+        for x, sums in zip(pmt_matrices, pmt_sums):
+            sums[start:stop] = sum_over_contact_sets(x.T, block, dtype=np.int32)
+        start = stop
+    if isinstance(pmt_matrix, tuple):
+        return pmt_sums
+    return pmt_sums[0]
+
+
+def sum_over_contact_sets(values, cs_indices_list, dtype=None):
+    """
+    Sum per-site values over each of the given contact sets. The indices of
+    all contact sets are concatenated so that the values are gathered once
+    and reduced segment by segment with np.add.reduceat.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Per-site values with one row per site.
+    cs_indices_list : list
+        A list of non-empty integer arrays, each holding the row indices of
+        the sites in a contact set.
+    dtype : numpy.dtype, optional
+        Type in which the sums are accumulated, that of values if None.
+
+    Returns
+    -------
+    numpy.ndarray
+        An array whose k-th row holds the sum of the rows of values over the
+        k-th contact set.
+
+    """
+    if not cs_indices_list:
+        return np.zeros(
+            (0,) + values.shape[1:],
+            dtype=values.dtype if dtype is None else dtype
+        )
+    flat_indices = np.concatenate(cs_indices_list)
+    offsets = np.cumsum([0] + [len(x) for x in cs_indices_list[:-1]])
+    return np.add.reduceat(values[flat_indices], offsets, axis=0, dtype=dtype)
+
+
 def read_enst_mp_count(input_file):
     """
     Reads transcript-level mutation probabilities and variant counts from disk
@@ -15,7 +15,7 @@ from Bio import BiopythonWarning
 from Bio.PDB import PDBParser, is_aa
 from Bio.SeqUtils import seq1
 
-from cosmis.utils import pdb_utils, seq_utils
+from cosmis.utils import io_utils, pdb_utils, seq_utils
 warnings.simplefilter('ignore', BiopythonWarning)
 
 
@@ -312,6 +312,10 @@ def main():
     with open(args.input, 'rt') as ipf:
         uniprot_sm_mapping = [line.strip().split() for line in ipf]
 
+    # permutation matrices are overwritten protein by protein
+    mis_pmt_buffer = seq_utils.PermutationBuffer()
+    syn_pmt_buffer = seq_utils.PermutationBuffer()
+
     # compute COSMIS scores
     for uniprot_id, model_path in uniprot_sm_mapping:
         if args.database == 'SWISS-MODEL':
@@ -420,10 +424,18 @@ def main():
         mis_p = codon_mis_probs / np.sum(codon_mis_probs)
         syn_p = codon_syn_probs / np.sum(codon_syn_probs)
         mis_pmt_matrix = seq_utils.permute_variants(
-            total_exp_mis_counts, len(pep_seq), mis_p
+            total_exp_mis_counts, len(pep_seq), mis_p,
+            out=mis_pmt_buffer.view(
+                len(pep_seq),
+                seq_utils.get_permutation_dtype(total_exp_mis_counts)
+            )
         )
         syn_pmt_matrix = seq_utils.permute_variants(
-            total_exp_syn_counts, len(pep_seq), syn_p
+            total_exp_syn_counts, len(pep_seq), syn_p,
+            out=syn_pmt_buffer.view(
+                len(pep_seq),
+                seq_utils.get_permutation_dtype(total_exp_syn_counts)
+            )
         )
 
         # index all contacts by residue ID
@@ -547,7 +559,9 @@ def main():
 
         with open(
                 file=os.path.join(output_dir, uniprot_id + '_cosmis.tsv'),
-                mode='wt'
+                mode='wt',
+                buffering=io_utils.OUTPUT_BUFFER_SIZE,
+                newline=''
         ) as opf:
             csv_writer = csv.writer(opf, delimiter='\t')
             csv_writer.writerow(get_dataset_headers())
@@ -28,7 +28,7 @@ from Bio import SeqIO
 from Bio.PDB import PDBParser, is_aa
 from Bio.SeqUtils import seq1
 
-from cosmis.utils import pdb_utils, seq_utils
+from cosmis.utils import io_utils, pdb_utils, seq_utils
 
 
 def parse_cmd():
@@ -154,8 +154,8 @@ def count_variants(variants):
         w = vv[0]  # wild-type amino acid
         v = vv[-1]  # mutant amino acid
         pos = vv[1:-1]  # position in the protein sequence
-        # only consider rare variants
-        if int(ac) / int(an) > 0.001:
+        # only consider rare variants, i.e. allele frequency <= 0.001
+        if int(ac) * 1000 > int(an):
             continue
         if w != v:  # missense variant
             missense_counts[int(pos)] += 1
@@ -461,7 +461,10 @@ def main():
             ]
         )
 
-    with open(file=args.output_file, mode='wt') as opf:
+    with open(
+            file=args.output_file, mode='wt',
+            buffering=io_utils.OUTPUT_BUFFER_SIZE, newline=''
+    ) as opf:
         header = [
             'uniprot_id', 'ensp_pos', 'ensp_aa',
             'cs_syn_poss', 'cs_mis_poss',
@@ -1,22 +1,17 @@
 #!/usr/bin/env python3
 
-import csv
-import gzip
 import json
 import os
 import sys
 import logging
 import warnings
 from argparse import ArgumentParser
-from collections import defaultdict
 
 import numpy as np
-from Bio import SeqIO
 from Bio import BiopythonWarning
 from Bio.PDB import PDBParser, is_aa
-from Bio.SeqUtils import seq1
 
-from cosmis.utils import pdb_utils, seq_utils
+from cosmis.utils import io_utils, pdb_utils, seq_utils
 warnings.simplefilter('ignore', BiopythonWarning)
 
 
@@ -56,33 +51,33 @@ def parse_cmd():
     return parser.parse_args()
 
 
-def get_ensembl_accession(record):
+def get_ensembl_accession(record_id):
     """
 
     Parameters
     ----------
-    record
+    record_id
 
     Returns
     -------
 
     """
-    parts = record.id.split('.')
+    parts = record_id.split('.')
     return parts[0]
 
 
-def get_uniprot_accession(record):
+def get_uniprot_accession(record_id):
     """
 
     Parameters
     ----------
-    record
+    record_id
 
     Returns
     -------
 
     """
-    parts = record.id.split('|')
+    parts = record_id.split('|')
     return parts[1]
 
 
@@ -104,87 +99,52 @@ def parse_config(config):
     return configs
 
 
-def count_variants(variants):
-    """
-    Collects the statistics about position-specific counts of missense and
-    synonymous variants.
-
-    Parameters
-    ----------
-    variants : list
-        A list of variant identifiers: ['A123B', 'C456D']
-
-    Returns
-    -------
-    dict
-        A dictionary where the key is amino acid position and the value is
-        the number of variants at this position. One dictionary for missense
-        variants and one dictionary for synonymous variants.
-
-    """
-    #
-    missense_counts = defaultdict(int)
-    synonymous_counts = defaultdict(int)
-    for variant in variants:
-        vv, _, _ = variant
-        w = vv[0]  # wild-type amino acid
-        v = vv[-1]  # mutant amino acid
-        pos = vv[1:-1]  # position in the protein sequence
-        # only consider rare variants
-        # if int(ac) / int(an) > 0.001:
-        #    continue
-        if w != v:  # missense variant
-            missense_counts[int(pos)] += 1
-        else:  # synonymous variant
-            synonymous_counts[int(pos)] += 1
-    return missense_counts, synonymous_counts
-
-
 def retrieve_data(uniprot_id, enst_ids, pep_dict, cds_dict, variant_dict):
     """
     """
     pep_seq = pep_dict[uniprot_id]
 
-    valid_ensts = []
+    # validate the transcripts and track the one with most variable
+    # positions in a single pass
+    num_valid = 0
+    first_valid = None
+    max_len = 0
+    right_enst = None
     for enst_id in enst_ids:
-        try:
-            cds_seq = cds_dict[enst_id].seq
-        except KeyError:
+        cds_seq = cds_dict.get(enst_id)
+        if cds_seq is None:
             continue
         # skip if the CDS is incomplete
         if not seq_utils.is_valid_cds(cds_seq):
             print('Error: Invalid CDS.'.format(enst_id))
             continue
-        if len(pep_seq) == len(cds_seq) // 3 - 1:
-            valid_ensts.append(enst_id)
-    if not valid_ensts:
+        if len(pep_seq) != len(cds_seq) // 3 - 1:
+            continue
+        num_valid += 1
+        if first_valid is None:
+            first_valid = enst_id
+        record = variant_dict.get(enst_id)
+        if record is None:
+            continue
+        var_pos = len(record['variants'])
+        if max_len < var_pos:
+            max_len = var_pos
+            right_enst = enst_id
+    if not num_valid:
         raise ValueError(
             'Error: {} are not compatible with {}.'.format(enst_ids, uniprot_id)
         )
 
-    if len(valid_ensts) == 1:
-        enst_id = valid_ensts[0]
-        cds = cds_dict[enst_id].seq
-        if enst_id not in variant_dict.keys():
-           raise KeyError('Error: No record for {} in gnomAD.'.format(uniprot_id))
-        variants = variant_dict[enst_id]['variants']
-        return enst_id, pep_seq, cds, variants
+    # a single valid transcript is used even if it has no variants
+    if num_valid == 1:
+        right_enst = first_valid
+        if right_enst not in variant_dict:
+            raise KeyError('Error: No record for {} in gnomAD.'.format(uniprot_id))
+    elif right_enst is None:
+        raise KeyError('Error: No record for {} in gnomAD.'.format(uniprot_id))
 
-    # if multiple transcripts are valid
-    # get the one with most variable positions
-    max_len = 0
-    right_enst = ''
-    for enst_id in valid_ensts:
-        try:
-            var_pos = len(variant_dict[enst_id]['variants'])
-        except KeyError:
-            continue
-        if max_len < var_pos:
-            max_len = var_pos
-            right_enst = enst_id
-    cds = cds_dict[right_enst].seq
+    cds = cds_dict[right_enst]
     variants = variant_dict[right_enst]['variants']
-
     return right_enst, pep_seq, cds, variants
 
 
@@ -209,45 +169,59 @@ def get_dataset_headers():
     return header
 
 
-def load_datasets(configs):
+# columns written in scientific notation, all other floating point columns
+# are written with three decimal places
+SCI_COLUMNS = ('cs_syn_prob', 'cs_mis_prob', 'mis_p_value', 'syn_p_value')
+
+# columns copied from the transcript-level counts, written without rounding
+RAW_COLUMNS = ('enst_syn_obs', 'enst_mis_obs', 'enst_syn_exp', 'enst_mis_exp')
+
+
+def load_datasets(configs, uniprot_id):
     """
+    Load the databases, the parsed FASTA and gnomAD files are cached next
+    to the files so that later runs do not need to parse them again.
 
     Parameters
     ----------
     configs
+    uniprot_id : str
+        UniProt ID of the protein, only the sequences of this protein and
+        its transcripts are kept.
 
     Returns
     -------
 
     """
-    # ENSEMBL cds
+    # parse the file that maps Ensembl transcript IDs to PDB IDs
+    uniprot_to_enst = io_utils.load_json(configs['uniprot_to_enst'])
+
+    # ENSEMBL cds, the whole cached dict is dropped once the transcripts
+    # of the protein are picked out of it
     print('Reading ENSEMBL CDS database ...')
-    with gzip.open(configs['ensembl_cds'], 'rt') as cds_handle:
-        enst_cds_dict = SeqIO.to_dict(
-            SeqIO.parse(cds_handle, format='fasta'),
-            key_function=get_ensembl_accession
-        )
+    enst_ids = set(uniprot_to_enst.get(uniprot_id, []))
+    enst_cds_dict = {
+        k: v for k, v in io_utils.read_fasta(
+            configs['ensembl_cds'], get_ensembl_accession
+        ).items() if k in enst_ids
+    }
 
     # ENSEMBL peptide sequences
     print('Reading UniProt protein sequence database ...')
-    with gzip.open(configs['uniprot_pep'], 'rt') as pep_handle:
-        pep_dict = SeqIO.to_dict(
-            SeqIO.parse(pep_handle, format='fasta'),
-            key_function=get_uniprot_accession
-        )
+    pep_dict = {
+        k: v for k, v in io_utils.read_fasta(
+            configs['uniprot_pep'], get_uniprot_accession
+        ).items() if k == uniprot_id
+    }
 
     # parse gnomad transcript-level variants
     print('Reading gnomAD variant database ...')
-    with open(configs['gnomad_variants'], 'rt') as variant_handle:
-        # transcript_variants will be a dict of dicts where major version
-        # ENSEMBL transcript IDs are the first level keys and "ccds", "ensp",
-        # "swissprot", "variants" are the second level keys. The value of each
-        # second-level key is a Python list.
-        enst_variants = json.load(variant_handle)
-
-    # parse the file that maps Ensembl transcript IDs to PDB IDs
-    with open(configs['uniprot_to_enst'], 'rt') as ipf:
-        uniprot_to_enst = json.load(ipf)
+    # transcript_variants will be a dict of dicts where major version
+    # ENSEMBL transcript IDs are the first level keys and "ccds", "ensp",
+    # "swissprot", "variants" are the second level keys. The value of each
+    # second-level key is a Python list. Only the few transcripts of the
+    # protein are ever decoded.
+    enst_variants = io_utils.load_lazy_json(configs['gnomad_variants'])
 
     # get transcript mutation probabilities and variant counts
     print('Reading transcript mutation probabilities and variant counts ...')
@@ -278,7 +252,9 @@ def main():
     configs = parse_config(args.config)
 
     # load datasets
-    cds_dict, pep_dict, variant_dict, uniprot_to_enst, enst_mp_counts = load_datasets(configs)
+    cds_dict, pep_dict, variant_dict, uniprot_to_enst, enst_mp_counts = load_datasets(
+        configs, args.uniprot_id
+    )
 
     # compute COSMIS scores
     pdb_file = args.pdb_file
@@ -331,7 +307,8 @@ def main():
             '{} for {}.'.format(pdb_file, uniprot_id)
         )
         sys.exit(1)
-    all_contacts = pdb_utils.search_for_all_contacts(
+    # index the residue numbers of all contacts by residue
+    indexed_contacts = pdb_utils.index_contact_positions(
         all_aa_residues, radius=8
     )
 
@@ -341,18 +318,28 @@ def main():
     all_cds_ns_counts = seq_utils.count_poss_ns_variants(cds)
     cds_ns_sites = seq_utils.count_ns_sites(cds)
 
-    # tabulate variants at each site
-    # missense_counts and synonymous_counts are dictionary that maps
-    # amino acid positions to variant counts
-    missense_counts, synonymous_counts = count_variants(variants)
+    # tabulate variants at each site, the count arrays are indexed
+    # by amino acid position
+    mis_count_arr, syn_count_arr = seq_utils.tabulate_variants(
+        variants, len(pep_seq)
+    )
 
     # convert variant count to site variability
-    site_variability_missense = {
-        pos: 1 for pos, _ in missense_counts.items()
-    }
-    site_variability_synonymous = {
-        pos: 1 for pos, _ in synonymous_counts.items()
-    }
+    mis_var_arr = (mis_count_arr > 0).astype(np.int32)
+    syn_var_arr = (syn_count_arr > 0).astype(np.int32)
+
+    # per-site variant columns indexed by amino acid position: missense
+    # and synonymous site variability, missense and synonymous counts
+    site_counts = np.column_stack(
+        [mis_var_arr, syn_var_arr, mis_count_arr, syn_count_arr]
+    )
+
+    # per-codon columns indexed by zero-based codon number: possible
+    # missense and synonymous variants, missense and synonymous sites,
+    # synonymous and missense mutation rates
+    codon_props = np.column_stack(
+        [all_cds_ns_counts, cds_ns_sites, codon_mutation_rates]
+    )
 
     # compute the total number of missense variants
     try:
@@ -376,62 +363,49 @@ def main():
         total_exp_syn_counts, len(pep_seq), syn_p
     )
 
-    # index all contacts by residue ID
-    indexed_contacts = defaultdict(list)
-    for c in all_contacts:
-        indexed_contacts[c.get_res_a()].append(c.get_res_b())
-        indexed_contacts[c.get_res_b()].append(c.get_res_a())
+    # residues of the chain by residue number, i.e. those that chain[pos]
+    # would return, resolved once instead of a lookup per position
+    res_by_pos = {
+        r.get_id()[1]: r for r in chain
+        if r.get_id()[0] == ' ' and r.get_id()[2] == ' '
+    }
+
+    # compare the UniProt sequence with the residues of the chain at once,
+    # positions missing from the chain are skipped in the loop below
+    pdb_seq = np.array([
+        pdb_utils.THREE_TO_ONE.get(res_by_pos[i].get_resname(), 'X')
+        if i in res_by_pos else seq_aa
+        for i, seq_aa in enumerate(pep_seq, start=1)
+    ])
+    mismatches = np.flatnonzero(pdb_seq != np.array(list(pep_seq)))
+    first_mismatch = mismatches[0] + 1 if mismatches.size else None
 
     valid_case = True
+    contact_sets = []
+    residue_fields = []
     for seq_pos, seq_aa in enumerate(pep_seq, start=1):
-        try:
-            res = chain[seq_pos]
-        except KeyError:
+        res = res_by_pos.get(seq_pos)
+        if res is None:
             print('PDB file is missing residue:', seq_aa, 'at', seq_pos)
             continue
-        pdb_aa = seq1(res.get_resname())
-        if seq_aa != pdb_aa:
+        if seq_pos == first_mismatch:
             print('Residue in UniProt sequence did not match that in PDB at', seq_pos)
             print('Skip to the next protein ...')
             valid_case = False
             break
 
-        contact_res = indexed_contacts[res]
-        num_contacts = len(contact_res)
-        contacts_pdb_pos = [r.get_id()[1] for r in contact_res]
+        contacts_pdb_pos = indexed_contacts.get(res.get_full_id(), [])
+        num_contacts = len(contacts_pdb_pos)
         seq_seps = ';'.join(
             str(x) for x in [i - seq_pos for i in contacts_pdb_pos]
         )
 
-        mis_var_sites = site_variability_missense.setdefault(seq_pos, 0)
-        total_mis_sites = cds_ns_sites[seq_pos - 1][0]
-        syn_var_sites = site_variability_synonymous.setdefault(seq_pos, 0)
-        total_syn_sites = cds_ns_sites[seq_pos - 1][1]
-        total_missense_obs = missense_counts.setdefault(seq_pos, 0)
-        total_synonymous_obs = synonymous_counts.setdefault(seq_pos, 0)
-        total_missense_poss = all_cds_ns_counts[seq_pos - 1][0]
-        total_synonyms_poss = all_cds_ns_counts[seq_pos - 1][1]
-        total_synonymous_rate = codon_mutation_rates[seq_pos - 1][0]
-        total_missense_rate = codon_mutation_rates[seq_pos - 1][1]
-        for j in contacts_pdb_pos:
-            # count the total # observed variants in contacting residues
-            mis_var_sites += site_variability_missense.setdefault(j, 0)
-            syn_var_sites += site_variability_synonymous.setdefault(j, 0)
-            total_missense_obs += missense_counts.setdefault(j, 0)
-            total_synonymous_obs += synonymous_counts.setdefault(j, 0)
-
-            # count the total # expected variants
-            try:
-                total_missense_poss += all_cds_ns_counts[j - 1][0]
-                total_synonyms_poss += all_cds_ns_counts[j - 1][1]
-                total_synonymous_rate += codon_mutation_rates[j - 1][0]
-                total_missense_rate += codon_mutation_rates[j - 1][1]
-                total_mis_sites += cds_ns_sites[j - 1][0]
-                total_syn_sites += cds_ns_sites[j - 1][1]
-            except IndexError:
-                valid_case = False
-                break
-        if not valid_case:
+        # contacts outside of the CDS invalidate the case, i.e. those that
+        # could not index both the site and the codon arrays
+        cs_sites = np.array([seq_pos] + contacts_pdb_pos, dtype=np.intp)
+        if cs_sites.max() > len(codon_props) or \
+                cs_sites.min() < 1 - len(codon_props):
+            valid_case = False
             break
 
         try:
@@ -447,34 +421,77 @@ def main():
             continue
         gc_fraction = seq_utils.gc_content(seq_context)
 
-        mis_pmt_mean, mis_pmt_sd, mis_p_value = seq_utils.get_permutation_stats(
-            mis_pmt_matrix, contacts_pdb_pos + [seq_pos], total_missense_obs
+        # the totals and permutation statistics are computed once all
+        # contact sets are known
+        contact_sets.append(cs_sites)
+        residue_fields.append(
+            (seq_pos, seq_aa, seq_seps, num_contacts, gc_fraction)
         )
-        syn_pmt_mean, syn_pmt_sd, syn_p_value = seq_utils.get_permutation_stats(
-            syn_pmt_matrix, contacts_pdb_pos + [seq_pos], total_synonymous_obs
-        )
-        # compute the fraction of expected missense variants
+
+    if not valid_case:
+        sys.exit(1)
+
+    # count the total # observed and expected variants in all contact sets,
+    # positions outside of the protein have no variants and are pointed at
+    # row 0, which holds no amino acid position
+    site_counts[0] = 0
+    site_totals = seq_utils.sum_over_contact_sets(
+        site_counts,
+        [np.where((x > 0) & (x < len(site_counts)), x, 0) for x in contact_sets]
+    )
+    codon_totals = seq_utils.sum_over_contact_sets(
+        codon_props, [x - 1 for x in contact_sets]
+    )
+    for k, (seq_pos, seq_aa, seq_seps, num_contacts, gc_fraction) in \
+            enumerate(residue_fields):
+        mis_var_sites, syn_var_sites, total_missense_obs, \
+            total_synonymous_obs = site_totals[k].tolist()
+        total_missense_poss, total_synonyms_poss, total_mis_sites, \
+            total_syn_sites, total_synonymous_rate, total_missense_rate = \
+            codon_totals[k].tolist()
         cosmis.append(
             [
                 uniprot_id, right_enst, seq_pos, seq_aa, seq_seps,
                 num_contacts + 1,
                 syn_var_sites,
-                '{:.3f}'.format(total_syn_sites),
+                total_syn_sites,
                 mis_var_sites,
-                '{:.3f}'.format(total_mis_sites),
-                total_synonyms_poss,
-                total_missense_poss,
-                '{:.3f}'.format(gc_fraction),
-                '{:.3e}'.format(total_synonymous_rate),
+                total_mis_sites,
+                int(total_synonyms_poss),
+                int(total_missense_poss),
+                gc_fraction,
+                total_synonymous_rate,
                 total_synonymous_obs,
-                '{:.3e}'.format(total_missense_rate),
-                total_missense_obs,
-                '{:.3f}'.format(mis_pmt_mean),
-                '{:.3f}'.format(mis_pmt_sd),
-                '{:.3e}'.format(mis_p_value),
-                '{:.3f}'.format(syn_pmt_mean),
-                '{:.3f}'.format(syn_pmt_sd),
-                '{:.3e}'.format(syn_p_value),
+                total_missense_rate,
+                total_missense_obs
+            ]
+        )
+
+    # permutation statistics of all contact sets at once
+    mis_pmt_sums, syn_pmt_sums = seq_utils.get_contact_set_sums(
+        (mis_pmt_matrix, syn_pmt_matrix), contact_sets
+    )
+    mis_pmt_means, mis_pmt_sds = seq_utils.get_mean_and_sd(mis_pmt_sums)
+    syn_pmt_means, syn_pmt_sds = seq_utils.get_mean_and_sd(syn_pmt_sums)
+    # observed counts in the dtype of the sums so that the comparison does
+    # not promote the sums to a float64 copy
+    mis_obs = site_totals[:, 2].astype(mis_pmt_sums.dtype)
+    syn_obs = site_totals[:, 3].astype(syn_pmt_sums.dtype)
+    mis_p_values = (
+        np.sum(mis_pmt_sums <= mis_obs[:, np.newaxis], axis=1) + 1
+    ) / 10001
+    syn_p_values = (
+        np.sum(syn_pmt_sums <= syn_obs[:, np.newaxis], axis=1) + 1
+    ) / 10001
+    for k, row in enumerate(cosmis):
+        row.extend(
+            [
+                mis_pmt_means[k],
+                mis_pmt_sds[k],
+                mis_p_values[k],
+                syn_pmt_means[k],
+                syn_pmt_sds[k],
+                syn_p_values[k],
                 enst_mp_counts[right_enst][2],
                 enst_mp_counts[right_enst][4],
                 total_exp_syn_counts,
@@ -483,16 +500,10 @@ def main():
             ]
         )
 
-    if not valid_case:
-        sys.exit(1)
-
-    with open(
-            file=args.output_file,
-            mode='wt'
-    ) as opf:
-        csv_writer = csv.writer(opf, delimiter='\t')
-        csv_writer.writerow(get_dataset_headers())
-        csv_writer.writerows(cosmis)
+    io_utils.write_table(
+        cosmis, get_dataset_headers(), args.output_file,
+        sci_columns=SCI_COLUMNS, raw_columns=RAW_COLUMNS
+    )
 
 
 if __name__ == '__main__':
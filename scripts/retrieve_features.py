@@ -4,7 +4,7 @@
 To add a brief summary of this script.
 """
 
-import os, csv
+import os
 import gzip
 import json
 import logging
@@ -14,7 +14,7 @@ import numpy as np
 from collections import defaultdict
 from argparse import ArgumentParser
 from cosmis.mapping.sifts import SIFTS
-from cosmis.utils import pdb_utils
+from cosmis.utils import io_utils, pdb_utils
 from Bio import SeqIO
 from Bio.SeqUtils import seq1
 from Bio.PDB import is_aa
@@ -29,6 +29,27 @@ from Bio import BiopythonWarning
 import warnings
 warnings.simplefilter('ignore', BiopythonWarning)
 
+# nucleotides allowed in coding sequences
+ACGT = frozenset('ACGT')
+
+# columns of the feature files
+FEATURE_HEADER = [
+    'enst_id', 'ensp_id', 'uniprot_id', 'ensp_pos', 'ensp_aa', 
+    'pdb_pos', 'pdb_aa', 'pdb_id', 'chain_id', 'seq_separation',
+    'num_contacts', 'gc_count', 'cg_count', 'gc_content',
+    'syn_prob', 'mis_prob', 'phylop_mean', 'phylop_sd', 'seqcov',
+    'syn_count_obs', 'mis_count_obs', 'syn_count_pos', 'mis_count_pos'
+]
+
+# columns written in scientific notation
+SCI_COLUMNS = ('syn_prob', 'mis_prob')
+
+# integer columns that are missing for residues not matching the structure
+INT_COLUMNS = (
+    'num_contacts', 'gc_count', 'cg_count', 'syn_count_obs', 'mis_count_obs',
+    'syn_count_pos', 'mis_count_pos'
+)
+
 
 def parse_cmd():
     """
@@ -216,8 +237,8 @@ def count_variants(variants):
         w = vv[0]  # wild-type amino acid
         v = vv[-1]  # mutant amino acid
         pos = vv[1:-1]  # position in the protein sequence
-        # only consider rare variants
-        if int(ac) / int(an) > 0.001:
+        # only consider rare variants, i.e. allele frequency <= 0.001
+        if int(ac) * 1000 > int(an):
             continue
         if w != v:  # missense variant
             missense_counts[int(pos)] += 1
@@ -237,8 +258,7 @@ def get_phylop_scores(score_file):
     -------
 
     """
-    with gzip.open(score_file, 'rt') as ipf:
-        return json.load(ipf)
+    return io_utils.load_lazy_json(score_file)
 
 
 def main():
@@ -284,29 +304,25 @@ def main():
 
     # parse gnomad transcript-level variants
     print('Reading gnomAD variant database ...')
-    with open(configs['gnomad_variants'], 'rt') as variant_handle:
-        # transcript_variants will be a dict of dicts where major version
-        # ENSEMBL transcript IDs are the first level keys and "ccds", "ensp",
-        # "swissprot", "variants" are the second level keys. The value of each
-        # second-level key is a Python list.
-        transcript_variants = json.load(variant_handle)
+    # transcript_variants will be a dict of dicts where major version
+    # ENSEMBL transcript IDs are the first level keys and "ccds", "ensp",
+    # "swissprot", "variants" are the second level keys. The value of each
+    # second-level key is a Python list.
+    transcript_variants = io_utils.load_json(configs['gnomad_variants'])
 
     # parse the file that maps Ensembl transcript IDs to PDB IDs 
-    with open(configs['enst_to_pdb'], 'rt') as ipf:
-        enst_to_pdb = json.load(ipf)
+    enst_to_pdb = io_utils.load_json(configs['enst_to_pdb'])
 
     # get phylop scores
     enst_to_phylop = get_phylop_scores(configs['enst_to_phylop'])
 
     # sequencing depth of coverage
     print('Loading sequencing depths of coverage ...')
-    with gzip.open(configs['coord_to_seqcov'], 'rt') as ipf:
-        coord_to_seqcov = json.load(ipf)
+    coord_to_seqcov = io_utils.load_lazy_json(configs['coord_to_seqcov'])
 
     # genomic coordinates of transcripts
     print('Loading transcript genomic coordinates ...')
-    with gzip.open(configs['enst_to_coord'], 'rt') as ipf:
-        enst_to_coord = json.load(ipf)
+    enst_to_coord = io_utils.load_lazy_json(configs['enst_to_coord'])
 
     # get the directory where all output files will be stored
     output_dir = os.path.abspath(configs['output_dir'])
@@ -406,7 +422,7 @@ def main():
                 continue
 
             # check that the CDS does not contain invalid nucleotides
-            if any([x not in {'A', 'T', 'C', 'G'} for x in set(transcript_cds)]):
+            if not ACGT.issuperset(str(transcript_cds)):
                 logging.critical('Invalid CDS! Skipped.')
                 print(transcript_cds)
                 continue
@@ -476,6 +492,13 @@ def main():
 
             # row identifier for each COSMIS score record
             id_fields = [transcript, ensp_id, uniprot_id]
+
+            # bind lookups done for every residue and contact to local names
+            get_missense_count = missense_counts.get
+            get_synonymous_count = synonymous_counts.get
+            transcript_coords = enst_to_coord[transcript]['genome_coord']
+            chrom = enst_to_coord[transcript]['chrom']
+            chrom_seqcov = coord_to_seqcov.get(chrom, {})
             
             for i, a in enumerate(transcript_pep, start=1):
                 # @TODO need to get the corresponding position in the PDB file
@@ -508,7 +531,7 @@ def main():
                         'in the SIFTS residue-level mapping.'
                     )
                     features.append(
-                        id_fields + [i, a, pdb_pos, pdb_aa] + [np.nan] * 15
+                        id_fields + [i, a, pdb_pos, pdb_aa] + [np.nan] * 16
                     )
                     continue
 
@@ -519,8 +542,8 @@ def main():
                     str(x) for x in [i - pdb_pos for i in contacts_pdb_pos]
                 )
 
-                total_missense_obs = missense_counts.setdefault(i, 0)
-                total_synonymous_obs = synonymous_counts.setdefault(i, 0)
+                total_missense_obs = get_missense_count(i, 0)
+                total_synonymous_obs = get_synonymous_count(i, 0)
                 try:
                     prob_syn = probs_cds[i - 1][0]
                     pos_count_syn = counts_cds[i - 1][0]
@@ -532,7 +555,7 @@ def main():
                     continue
 
                 genome_coords = copy.deepcopy(
-                    enst_to_coord[transcript]['genome_coord'][i - 1][3]
+                    transcript_coords[i - 1][3]
                 )
 
                 # size of contact set
@@ -576,8 +599,8 @@ def main():
                             continue
 
                         # count the total # observed variants in contacting residues
-                        total_missense_obs += missense_counts.setdefault(ensp_pos, 0)
-                        total_synonymous_obs += synonymous_counts.setdefault(ensp_pos, 0)
+                        total_missense_obs += get_missense_count(ensp_pos, 0)
+                        total_synonymous_obs += get_synonymous_count(ensp_pos, 0)
                         # count the total # expected variants
                         try:
                             prob_syn += probs_cds[ensp_pos - 1][0]
@@ -598,16 +621,15 @@ def main():
                     # get all sequencing depths of coverage
                     try:
                         genome_coords.extend(
-                            enst_to_coord[transcript]['genome_coord'][ensp_pos - 1][3]
+                            transcript_coords[ensp_pos - 1][3]
                         )
                     except IndexError:
                         print('{} index out of range: {}'.format(transcript, ensp_pos))
                         continue
-                    chrom = enst_to_coord[transcript]['chrom']
                     seqcov = []
                     for coord in genome_coords:
                         try:
-                            seqcov.append(coord_to_seqcov[chrom][str(coord)][0])
+                            seqcov.append(chrom_seqcov[str(coord)][0])
                         except KeyError:
                             continue
 
@@ -621,12 +643,12 @@ def main():
                         cs_size,
                         gc_count,
                         cg_count,
-                        '%.3f' % gc_fraction,
-                        '%.3e' % prob_syn,
-                        '%.3e' % prob_mis,
-                        '%.3f' % np.mean(cs_phylop_scores),
-                        "%.3f" % np.std(cs_phylop_scores),
-                        "%.3f" % np.mean(seqcov),
+                        gc_fraction,
+                        prob_syn,
+                        prob_mis,
+                        np.mean(cs_phylop_scores),
+                        np.std(cs_phylop_scores),
+                        np.mean(seqcov),
                         total_synonymous_obs,
                         total_missense_obs,
                         pos_count_syn,
@@ -634,17 +656,10 @@ def main():
                     ]
                 )
 
-            with open(file=feature_file, mode='wt') as opf:
-                header = [
-                    'enst_id', 'ensp_id', 'uniprot_id', 'ensp_pos', 'ensp_aa', 
-                    'pdb_pos', 'pdb_aa', 'pdb_id', 'chain_id', 'seq_separation',
-                    'num_contacts', 'gc_count', 'cg_count', 'gc_content',
-                    'syn_prob', 'mis_prob', 'phylop_mean', 'phylop_sd', 'seqcov',
-                    'syn_count_obs', 'mis_count_obs', 'syn_count_pos', 'mis_count_pos'
-                ]
-                csv_writer = csv.writer(opf, delimiter='\t')
-                csv_writer.writerow(header)
-                csv_writer.writerows(features)
+            io_utils.write_table(
+                features, FEATURE_HEADER, feature_file,
+                sci_columns=SCI_COLUMNS, int_columns=INT_COLUMNS, na_rep='NA'
+            )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+
+from cosmis.utils import io_utils
+
+
+class WriteTableTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_file = os.path.join(self.tmp_dir.name, 'table.tsv')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def read_lines(self):
+        with open(self.output_file, 'rt', newline='') as ipf:
+            return ipf.read().split('\n')
+
+    def test_formats_columns(self):
+        rows = [
+            ['P51787', 1.23456, 1.7e-05, 1.7e-05, 1],
+            ['Q14524', 2.0, np.nan, 3.0, None],
+        ]
+        header = ['uniprot_id', 'gc', 'prob', 'raw', 'count']
+        io_utils.write_table(
+            rows, header, self.output_file, sci_columns=('prob',),
+            int_columns=('count',), raw_columns=('raw',), na_rep='NA'
+        )
+        self.assertEqual(
+            self.read_lines(),
+            [
+                'uniprot_id\tgc\tprob\traw\tcount',
+                'P51787\t1.235\t1.700e-05\t1.7e-05\t1',
+                'Q14524\t2.000\tNA\t3.0\tNA',
+                '',
+            ]
+        )
+
+    def test_empty_table(self):
+        io_utils.write_table([], ['a', 'b'], self.output_file)
+        self.assertEqual(self.read_lines(), ['a\tb', ''])
+
+
+class LoadCachedTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.source_file = os.path.join(self.tmp_dir.name, 'source.txt')
+        with open(self.source_file, 'wt') as opf:
+            opf.write('content')
+        self.cache_file = self.source_file + '.pkl'
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    def loader(path):
+        with open(path, 'rt') as ipf:
+            return ipf.read()
+
+    def write_cache(self, content):
+        with open(self.cache_file, 'wb') as opf:
+            opf.write(content)
+
+    def assert_rebuilt(self):
+        self.assertEqual(
+            io_utils.load_cached(self.source_file, self.loader), 'content'
+        )
+        with open(self.cache_file, 'rb') as ipf:
+            self.assertEqual(pickle.load(ipf), 'content')
+        # no temporary file is left behind
+        self.assertEqual(
+            sorted(os.listdir(self.tmp_dir.name)),
+            ['source.txt', 'source.txt.pkl']
+        )
+
+    def test_truncated_cache(self):
+        self.write_cache(pickle.dumps('cached')[:-3])
+        self.assert_rebuilt()
+
+    def test_stale_cache(self):
+        # refers to a module that cannot be imported, as a cache written by
+        # another version of a library may
+        self.write_cache(
+            pickle.dumps(LoadCachedTest).replace(b'tests', b'nomod', 1)
+        )
+        self.assert_rebuilt()
+
+    def test_fresh_cache(self):
+        io_utils.load_cached(self.source_file, self.loader)
+        self.write_cache(pickle.dumps('cached'))
+        self.assertEqual(
+            io_utils.load_cached(self.source_file, self.loader), 'cached'
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import time
+import tracemalloc
+import unittest
+
+import numpy as np
+
+from cosmis.utils import seq_utils
+
+
+def make_contact_sets(length, size, seed=0):
+    """
+    Random contact sets of nearby positions, one per position.
+
+    """
+    rng = np.random.default_rng(seed)
+    return [
+        [i] + rng.integers(
+            max(1, i - 30), min(length, i + 30) + 1, size - 1
+        ).tolist()
+        for i in range(1, length + 1)
+    ]
+
+
+def sum_per_site(pmt_matrix, cs_sites_list):
+    """
+    Contact-set sums computed one contact set at a time.
+
+    """
+    return np.array([
+        pmt_matrix[:, np.asarray(x) - 1].sum(axis=1) for x in cs_sites_list
+    ])
+
+
+class GetContactSetSumsTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+
+    def test_matches_per_site_sums(self):
+        length = 300
+        mis = seq_utils.permute_variants(3 * length, length, None, 500)
+        syn = seq_utils.permute_variants(length, length, None, 500)
+        cs_sites_list = make_contact_sets(length, 15)
+        mis_sums, syn_sums = seq_utils.get_contact_set_sums(
+            (mis, syn), cs_sites_list, block_size=64
+        )
+        np.testing.assert_array_equal(
+            mis_sums, sum_per_site(mis, cs_sites_list)
+        )
+        np.testing.assert_array_equal(
+            syn_sums, sum_per_site(syn, cs_sites_list)
+        )
+        np.testing.assert_array_equal(
+            seq_utils.get_contact_set_sums(mis, cs_sites_list), mis_sums
+        )
+
+    def test_sums_stay_integer(self):
+        length = 2000
+        n = 1000
+        mis = seq_utils.permute_variants(3 * length, length, None, n)
+        syn = seq_utils.permute_variants(length, length, None, n)
+        self.assertEqual(mis.dtype, np.int16)
+        cs_sites_list = make_contact_sets(length, 15)
+
+        tracemalloc.start()
+        pmt_sums = seq_utils.get_contact_set_sums((mis, syn), cs_sites_list)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        for x in pmt_sums:
+            self.assertEqual(x.dtype, np.int32)
+        # a float32 copy of either matrix would take twice its int16 size
+        sums_nbytes = sum(x.nbytes for x in pmt_sums)
+        self.assertLess(peak - sums_nbytes, 2 * mis.nbytes)
+
+    def test_long_protein(self):
+        length = 8000
+        n = 1000
+        pmt_matrix = seq_utils.permute_variants(3 * length, length, None, n)
+        cs_sites_list = make_contact_sets(length, 15)
+
+        start = time.perf_counter()
+        expected = sum_per_site(pmt_matrix, cs_sites_list)
+        per_site_time = time.perf_counter() - start
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        pmt_sums = seq_utils.get_contact_set_sums(pmt_matrix, cs_sites_list)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        np.testing.assert_array_equal(pmt_sums, expected)
+        # apart from the sums themselves, only blocks of columns are held,
+        # far less than a dense indicator or a float32 copy of the matrix
+        self.assertLess(peak - pmt_sums.nbytes, pmt_matrix.nbytes)
+        # no slower than summing contact set by contact set, with a margin
+        # for timing noise
+        self.assertLess(elapsed, 4 * per_site_time + 0.5)
+
+
+class PermutationBufferTest(unittest.TestCase):
+    def test_views_are_contiguous(self):
+        pmt_buffer = seq_utils.PermutationBuffer(n=100)
+        for length in (50, 30, 80, 20):
+            view = pmt_buffer.view(length)
+            self.assertEqual(view.shape, (100, length))
+            self.assertTrue(view.flags.c_contiguous)
+            pmt_matrix = seq_utils.permute_variants(40, length, None, 100, out=view)
+            self.assertIs(pmt_matrix, view)
+            np.testing.assert_array_equal(pmt_matrix.sum(axis=1), 40)
+
+    def test_dtype_change(self):
+        pmt_buffer = seq_utils.PermutationBuffer(n=10)
+        pmt_buffer.view(20)
+        view = pmt_buffer.view(20, dtype=np.int32)
+        self.assertEqual(view.dtype, np.int32)
+        self.assertTrue(view.flags.c_contiguous)
+
+
+if __name__ == '__main__':
+    unittest.main()